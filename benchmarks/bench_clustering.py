@@ -0,0 +1,53 @@
+"""
+Benchmark clustering-graph construction on synthetic graphs.
+
+Compares the NetworkX graph (with description attributes) against the integer
+edge list used for clustering, reporting build time and peak traced memory,
+then times hierarchical Leiden on the edge list.
+
+    python benchmarks/bench_clustering.py [--skip-leiden]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+# The summarizer module creates an OpenAI client at import time
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from graph_communities import CommunitySummarizer
+from bench_communities import synthetic_graph
+
+
+def measure(fn, *args):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def main():
+    summarizer = CommunitySummarizer()
+    skip_leiden = '--skip-leiden' in sys.argv
+    print(f"{'edges':>8} {'nx s':>8} {'nx MiB':>8} {'list s':>8} {'list MiB':>9} {'leiden s':>9}")
+    for num_edges in (10_000, 50_000, 100_000, 200_000):
+        _, relationships, _ = synthetic_graph(num_edges // 4, num_edges)
+
+        _, nx_time, nx_mem = measure(summarizer.create_nx_graph, relationships)
+        (names, edges), list_time, list_mem = measure(summarizer.create_edge_list, relationships)
+
+        leiden_time = float('nan')
+        if not skip_leiden:
+            start = time.perf_counter()
+            summarizer.create_communities(edges, names)
+            leiden_time = time.perf_counter() - start
+
+        print(f"{num_edges:>8} {nx_time:>8.3f} {nx_mem:>8.1f} {list_time:>8.3f} {list_mem:>9.1f} {leiden_time:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
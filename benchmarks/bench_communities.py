@@ -0,0 +1,60 @@
+"""
+Benchmark community grouping on synthetic graphs.
+
+Times CommunitySummarizer.get_communities for graphs of increasing size,
+using synthetic cluster assignments so no Leiden run or LLM call is needed.
+
+    python benchmarks/bench_communities.py
+"""
+from collections import namedtuple
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+# The summarizer module creates an OpenAI client at import time
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from llama_index.core.graph_stores.types import EntityNode, Relation
+from graph_communities import CommunitySummarizer
+
+Cluster = namedtuple('Cluster', ['node', 'cluster', 'parent_cluster', 'level'])
+
+
+def synthetic_graph(num_nodes, num_edges, cluster_size=5, seed=0):
+    rng = random.Random(seed)
+    names = [f"Entity {i}" for i in range(num_nodes)]
+    entities = [
+        EntityNode(name=name, label="OTHER", properties={"entity_description": name})
+        for name in names
+    ]
+    relationships = [
+        Relation(
+            label="RELATED_TO",
+            source_id=rng.choice(names),
+            target_id=rng.choice(names),
+            properties={"relationship_description": "synthetic"},
+        )
+        for _ in range(num_edges)
+    ]
+    clusters = [
+        Cluster(node=name, cluster=i // cluster_size, parent_cluster=None, level=0)
+        for i, name in enumerate(names)
+    ]
+    return entities, relationships, clusters
+
+
+def main():
+    summarizer = CommunitySummarizer()
+    print(f"{'nodes':>8} {'edges':>8} {'seconds':>9}")
+    for num_edges in (12_500, 25_000, 50_000, 100_000, 200_000):
+        num_nodes = num_edges // 4
+        entities, relationships, clusters = synthetic_graph(num_nodes, num_edges)
+        start = time.perf_counter()
+        summarizer.get_communities(clusters, entities, relationships)
+        print(f"{num_nodes:>8} {num_edges:>8} {time.perf_counter() - start:>9.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 import streamlit as st
-from generation import Generator
+from generation import Generator, GenerationResult
 from graph_communities import CommunitySummarizer
 from data_index import DataIndexer
 import plotly.express as px
@@ -7,6 +7,7 @@ import plotly.graph_objects as go
 import pandas as pd
 import networkx as nx
 import random
+from concurrent.futures import ThreadPoolExecutor
 
 # Custom color palette
 COLORS = {
@@ -19,6 +20,16 @@ COLORS = {
     'edge': '#95a5a6'
 }
 
+@st.cache_resource
+def load_components():
+    """Create the RAG components once per process so caches stay warm across reruns"""
+    summarizer = CommunitySummarizer()
+    indexer = DataIndexer()
+    summarizer.load()
+    generator = Generator(indexer, summarizer)
+    return summarizer, indexer, generator
+
+
 class InsuranceRAGApp:
     def __init__(self):
         st.set_page_config(
@@ -28,10 +39,7 @@ class InsuranceRAGApp:
         )
         
         # Initialize RAG components
-        self.summarizer = CommunitySummarizer()
-        self.indexer = DataIndexer()
-        self.summarizer.load()
-        self.generator = Generator(self.indexer, self.summarizer)
+        self.summarizer, self.indexer, self.generator = load_components()
 
     def render_sidebar(self):
         with st.sidebar:
@@ -85,9 +93,18 @@ class InsuranceRAGApp:
         
         if query:
             with st.spinner("🤔 Thinking..."):
-                response = self.generator.generate(query)
-                entities = (self.generator.get_entities(query))[:10]
+                # Near-duplicate questions reuse a cached answer and entities
+                cached = self.generator.get_cached_answer(query)
+                if cached is not None:
+                    all_entities = cached.entities
+                else:
+                    # One retrieval per question: entities and context together
+                    all_entities, context = self.generator.retrieve_context(query)
+                entities = all_entities[:10]
 
+            # Lay out the graph in the background while the answer streams
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                figure = pool.submit(self.build_entity_network, entities) if entities else None
                 
                 # Display results in styled tabs
                 tabs = st.tabs(["💡 Answer", "🔗 Related Concepts"])
@@ -101,14 +118,24 @@ class InsuranceRAGApp:
                     #     """,
                     #     unsafe_allow_html=True
                     # )
-                    st.info(response)
+                    if cached is not None:
+                        response = cached.answer
+                        st.info(response)
+                    else:
+                        response = st.write_stream(self.generator.stream_answer(query, context.summaries))
+                        self.generator.cache_answer(query, GenerationResult(
+                            answer=response,
+                            entities=all_entities,
+                            summaries=context.summaries,
+                            context_tokens=context.used_tokens,
+                            dropped_tokens=context.dropped_tokens,
+                        ))
                 
                 with tabs[1]:
                     if response != "I dont know - I am an Insurance Query Assistant.":
-                        entities = (self.generator.get_entities(query))[:10]
                         if entities:
                             # Display network visualization
-                            self.plot_entity_network(entities)
+                            st.plotly_chart(figure.result(), use_container_width=True)
                         
                             # Display entities list
                             st.markdown("#### Related Terms")
@@ -135,6 +162,10 @@ class InsuranceRAGApp:
     
     def plot_entity_network(self, entities):
         """Create a visually appealing network visualization"""
+        st.plotly_chart(self.build_entity_network(entities), use_container_width=True)
+
+    def build_entity_network(self, entities):
+        """Build the network visualization figure (safe to run off the main thread)"""
         #Create nodes dataframe
         nodes = pd.DataFrame([
             {
@@ -222,7 +253,7 @@ class InsuranceRAGApp:
             )
         )
         
-        st.plotly_chart(fig, use_container_width=True)
+        return fig
 
 
     def run(self):
@@ -0,0 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+import asyncio
+from concurrency import estimate_tokens, run_bounded
+import logging
+import openai
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def is_retryable(error):
+    """
+       True for transient API failures: rate limits, connection errors, timeouts and 5xx.
+       Other errors (e.g. a 400 for an input over the token limit) cannot succeed on retry.
+    """
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+class BatchEmbedder:
+    """
+    Embeds large lists of texts in batches bounded by input count and estimated tokens.
+    A bounded number of batches run concurrently, failed batches are retried on their
+    own with exponential backoff, and results are streamed back in input order.
+    """
+
+    def __init__(self, client, model="text-embedding-3-small", max_batch_size=1024,
+                 max_batch_tokens=100_000, max_workers=4, max_retries=5, backoff=1.0, aclient=None):
+        self.client = client
+        # Optional AsyncOpenAI client used by aembed
+        self.aclient = aclient
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="embed")
+
+    def make_batches(self, texts):
+        """
+           Split texts into consecutive batches within the count and token limits
+        """
+        batch, batch_tokens = [], 0
+        for text in texts:
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                yield batch
+                batch, batch_tokens = [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            yield batch
+
+    def embed_batch(self, batch):
+        """
+           Embed one batch, retrying transient failures with exponential backoff and jitter
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                data = self.client.embeddings.create(input=batch, model=self.model).data
+                return [d.embedding for d in data]
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = self.backoff * (2 ** attempt) * (1 + random.random())
+                logger.warning(f"Embedding batch of {len(batch)} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def iter_embeddings(self, texts):
+        """
+           Yield embeddings batch by batch in input order, keeping at most
+           2 * max_workers batches in flight
+        """
+        pending = deque()
+        for batch in self.make_batches(texts):
+            pending.append(self.executor.submit(self.embed_batch, batch))
+            if len(pending) >= 2 * self.max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def embed(self, texts):
+        """
+           Embed all texts and return the embeddings in input order
+        """
+        if len(texts) <= self.max_batch_size and sum(map(estimate_tokens, texts)) <= self.max_batch_tokens:
+            # Single batch: call inline rather than through the pool
+            return self.embed_batch(texts) if texts else []
+
+        embeddings = []
+        for batch_embeddings in self.iter_embeddings(texts):
+            embeddings.extend(batch_embeddings)
+        return embeddings
+
+    async def aembed_batch(self, batch):
+        data = (await self.aclient.embeddings.create(input=batch, model=self.model)).data
+        return [d.embedding for d in data]
+
+    async def aembed(self, texts):
+        """
+           Async counterpart of embed, with the same batching and retry policy:
+           at most max_workers batches in flight, transient failures retried with backoff
+        """
+        if not texts:
+            return []
+        results = await run_bounded(
+            list(self.make_batches(texts)),
+            self.aembed_batch,
+            max_concurrency=self.max_workers,
+            max_retries=self.max_retries,
+            backoff=self.backoff,
+            retryable=is_retryable,
+            progress=lambda done, total: None,
+        )
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+
+class AsyncMicroBatcher:
+    """
+    Coalesces embedding requests from concurrent coroutines into few API calls.
+    Requests arriving within `window` seconds of each other are embedded together,
+    in requests of at most max_batch_size texts sent through the embedder's
+    retrying aembed path, and each caller receives its own slice.
+    """
+
+    def __init__(self, embedder, window=0.005, max_batch_size=256):
+        self.embedder = embedder
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._pending_size = 0
+        self._timer = None
+        # Running flush tasks, referenced so they are not garbage collected mid-flight
+        self._tasks = set()
+
+    async def embed(self, texts):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((texts, future))
+        self._pending_size += len(texts)
+
+        if self._pending_size >= self.max_batch_size:
+            self._schedule_flush(loop, 0)
+        elif self._timer is None:
+            self._schedule_flush(loop, self.window)
+        return await future
+
+    def _schedule_flush(self, loop, delay):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = loop.call_later(delay, self._start_flush)
+
+    def _start_flush(self):
+        task = asyncio.ensure_future(self._flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush(self):
+        pending, self._pending = self._pending, []
+        self._pending_size = 0
+        self._timer = None
+        if not pending:
+            return
+
+        unique_texts = list(dict.fromkeys(text for texts, _ in pending for text in texts))
+        chunks = [unique_texts[i:i + self.max_batch_size] for i in range(0, len(unique_texts), self.max_batch_size)]
+        results = await asyncio.gather(
+            *[self.embedder.aembed(chunk) for chunk in chunks], return_exceptions=True
+        )
+
+        # A failed chunk only fails the callers that asked for one of its texts
+        by_text, errors = {}, {}
+        for chunk, result in zip(chunks, results):
+            if isinstance(result, BaseException):
+                errors.update(dict.fromkeys(chunk, result))
+            else:
+                by_text.update(zip(chunk, result))
+        for texts, future in pending:
+            if future.done():
+                continue
+            error = next((errors[text] for text in texts if text in errors), None)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result([by_text[text] for text in texts])
@@ -0,0 +1,281 @@
+from collections import OrderedDict
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+
+
+def normalize_text(text: str) -> str:
+    """
+       Normalize text for use as a cache key (case and whitespace insensitive)
+    """
+    return " ".join(text.split()).casefold()
+
+
+class LRUCache:
+    """
+    A thread-safe in-memory LRU cache with bounded size and optional TTL.
+    Tracks hit/miss counters so callers can report cache effectiveness.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, stored_at = item
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class DiskStore:
+    """
+    A small persistent key/value store backed by SQLite.
+    Values are stored as JSON together with the time they were written.
+    """
+
+    def __init__(self, path, table="cache"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get_many(self, keys, ttl=None):
+        """
+           Fetch the stored values for keys, skipping missing or expired ones
+        """
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT key, value, stored_at FROM {self.table} WHERE key IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                for key, value, stored_at in rows:
+                    if ttl is None or time.time() - stored_at < ttl:
+                        found[key] = json.loads(value)
+        return found
+
+    def get(self, key, default=None, ttl=None):
+        return self.get_many([key], ttl=ttl).get(key, default)
+
+    def set_many(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                [(key, json.dumps(value), now) for key, value in items],
+            )
+            self._conn.commit()
+
+    def set(self, key, value):
+        self.set_many([(key, value)])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: a bounded in-memory LRU in front of an
+    optional on-disk store. Keys combine the model name and normalized text.
+    """
+
+    def __init__(self, maxsize=4096, path=None):
+        self.memory = LRUCache(maxsize=maxsize)
+        self.disk = DiskStore(path, table="embeddings") if path else None
+        self.disk_hits = 0
+
+    def key(self, model, text):
+        return f"{model}:{normalize_text(text)}"
+
+    def get_many(self, model, texts):
+        """
+           Look up embeddings for texts.
+
+           Returns:
+               dict: Mapping of index in texts to cached embedding
+        """
+        found = {}
+        missing = {}
+        for i, text in enumerate(texts):
+            key = self.key(model, text)
+            embedding = self.memory.get(key)
+            if embedding is not None:
+                found[i] = embedding
+            else:
+                missing.setdefault(key, []).append(i)
+
+        if self.disk and missing:
+            stored = self.disk.get_many(list(missing))
+            for key, embedding in stored.items():
+                self.memory.set(key, embedding)
+                self.disk_hits += len(missing[key])
+                for i in missing[key]:
+                    found[i] = embedding
+        return found
+
+    def set_many(self, model, texts, embeddings):
+        items = [(self.key(model, text), embedding) for text, embedding in zip(texts, embeddings)]
+        for key, embedding in items:
+            self.memory.set(key, embedding)
+        if self.disk and items:
+            self.disk.set_many(items)
+
+    def stats(self):
+        stats = self.memory.stats()
+        # Disk hits were first counted as memory misses
+        stats["disk_hits"] = self.disk_hits
+        stats["misses"] -= self.disk_hits
+        return stats
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent calls: while a computation for a key is in flight,
+    other callers for the same key wait for and share its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = call
+
+        if not leader:
+            call["event"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = fn()
+            return call["result"]
+        except Exception as e:
+            call["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call["event"].set()
+
+
+class SynonymCache:
+    """
+    Memoizes synonym expansions keyed by normalized query, with LRU/TTL
+    eviction, optional persistence and single-flight deduplication.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None, path=None):
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.disk = DiskStore(path, table="synonyms") if path else None
+        self.flight = SingleFlight()
+        self._async_calls = {}
+
+    def get_or_compute(self, query, compute):
+        """
+           Return cached keywords for query, calling compute() at most once
+           per key across concurrent callers. Empty results are not cached.
+        """
+        key = normalize_text(query)
+        keywords = self.memory.get(key)
+        if keywords is not None:
+            return keywords
+
+        def load():
+            if self.disk:
+                stored = self.disk.get(key, ttl=self.ttl)
+                if stored is not None:
+                    self.memory.set(key, stored)
+                    return stored
+            result = compute()
+            if result:
+                self.memory.set(key, result)
+                if self.disk:
+                    self.disk.set(key, result)
+            return result
+
+        return self.flight.do(key, load)
+
+    async def aget_or_compute(self, query, compute):
+        """
+           Async counterpart of get_or_compute; compute is a coroutine function.
+           Concurrent identical queries on the event loop share one in-flight task.
+        """
+        key = normalize_text(query)
+        keywords = self.memory.get(key)
+        if keywords is not None:
+            return keywords
+
+        task = self._async_calls.get(key)
+        if task is None:
+            async def load():
+                try:
+                    if self.disk:
+                        stored = self.disk.get(key, ttl=self.ttl)
+                        if stored is not None:
+                            self.memory.set(key, stored)
+                            return stored
+                    result = await compute()
+                    if result:
+                        self.memory.set(key, result)
+                        if self.disk:
+                            self.disk.set(key, result)
+                    return result
+                finally:
+                    self._async_calls.pop(key, None)
+
+            task = asyncio.ensure_future(load())
+            self._async_calls[key] = task
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return self.memory.stats()
@@ -0,0 +1,203 @@
+from collections.abc import Mapping
+from cache import LRUCache
+import numpy as np
+import os
+import sqlite3
+import threading
+
+# Bumped whenever the on-disk layout changes
+FORMAT_VERSION = 3
+# Older formats that can still be read (version 1 has no hierarchy columns,
+# version 2 no summary embeddings)
+READABLE_FORMATS = (1, 2, 3)
+
+
+class CommunityStore(Mapping):
+    """
+    Versioned SQLite store of community summaries.
+
+    Behaves as a read-only cluster -> summary mapping that pages summary text in on
+    demand (with a small LRU), so only the entity -> community index needs to stay
+    resident after loading.
+    """
+
+    def __init__(self, path, cache_size=1024):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._cache = LRUCache(maxsize=cache_size)
+        self._len = None
+
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        format_version = int(meta.get("format_version", 0))
+        if format_version not in READABLE_FORMATS:
+            raise ValueError(
+                f"Unsupported communities store format {format_version} (expected {FORMAT_VERSION})"
+            )
+        self.version = meta.get("version")
+        self.format_version = format_version
+
+    @staticmethod
+    def write(path, summaries_dict, community_dict, summary_hashes=None, version=None,
+              community_levels=None, community_parents=None, embeddings=None):
+        """
+           Write a complete store to path, replacing any existing file atomically.
+           Summary embeddings (cluster -> vector) are stored with their summaries,
+           so they can never go out of sync with the cluster ids.
+        """
+        summary_hashes = summary_hashes or {}
+        embeddings = embeddings or {}
+        community_levels = community_levels or {}
+        community_parents = community_parents or {}
+        tmp_path = f"{path}.tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        conn = sqlite3.connect(tmp_path)
+        conn.executescript("""
+            CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE summaries (
+                cluster INTEGER PRIMARY KEY, summary TEXT NOT NULL, hash TEXT, level INTEGER, parent INTEGER,
+                embedding BLOB
+            );
+            CREATE TABLE memberships (entity TEXT NOT NULL, cluster INTEGER NOT NULL);
+            CREATE INDEX summaries_hash ON summaries (hash);
+        """)
+        conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?)",
+            [("format_version", str(FORMAT_VERSION)), ("version", version)],
+        )
+        conn.executemany(
+            "INSERT INTO summaries (cluster, summary, hash, level, parent, embedding) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (cluster, summary, summary_hashes.get(cluster),
+                 community_levels.get(cluster), community_parents.get(cluster),
+                 np.asarray(embeddings[cluster], dtype=np.float32).tobytes() if cluster in embeddings else None)
+                for cluster, summary in summaries_dict.items()
+            ],
+        )
+        conn.executemany(
+            "INSERT INTO memberships (entity, cluster) VALUES (?, ?)",
+            [(entity, cluster) for entity, clusters in community_dict.items() for cluster in clusters],
+        )
+        conn.commit()
+        conn.close()
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def read_version(path):
+        """
+           Build version recorded in the store at path, without loading anything else
+        """
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def load_community_dict(self):
+        """
+           Entity name -> list of community ids, in insertion order
+        """
+        community_dict = {}
+        with self._lock:
+            rows = self._conn.execute("SELECT entity, cluster FROM memberships ORDER BY rowid")
+            for entity, cluster in rows:
+                community_dict.setdefault(entity, []).append(cluster)
+        return community_dict
+
+    def load_hierarchy(self):
+        """
+           Community id -> level and community id -> parent id (empty for format 1)
+        """
+        if self.format_version < 2:
+            return {}, {}
+        levels, parents = {}, {}
+        with self._lock:
+            for cluster, level, parent in self._conn.execute("SELECT cluster, level, parent FROM summaries"):
+                if level is not None:
+                    levels[cluster] = level
+                    parents[cluster] = parent
+        return levels, parents
+
+    def load_embeddings(self):
+        """
+           Stored summary embeddings as (cluster ids, matrix with one row per cluster),
+           or (None, None) when the store has none
+        """
+        if self.format_version < 3:
+            return None, None
+        clusters, rows = [], []
+        with self._lock:
+            query = "SELECT cluster, embedding FROM summaries WHERE embedding IS NOT NULL ORDER BY cluster"
+            for cluster, embedding in self._conn.execute(query):
+                clusters.append(cluster)
+                rows.append(np.frombuffer(embedding, dtype=np.float32))
+        if not rows:
+            return None, None
+        return np.asarray(clusters, dtype=np.int64), np.vstack(rows)
+
+    def __getitem__(self, cluster):
+        summary = self._cache.get(cluster)
+        if summary is not None:
+            return summary
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary FROM summaries WHERE cluster = ?", (cluster,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(cluster)
+        self._cache.set(cluster, row[0])
+        return row[0]
+
+    def __iter__(self):
+        with self._lock:
+            clusters = [row[0] for row in self._conn.execute("SELECT cluster FROM summaries ORDER BY cluster")]
+        return iter(clusters)
+
+    def __len__(self):
+        if self._len is None:
+            with self._lock:
+                self._len = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        return self._len
+
+    def summaries_for_hashes(self, hashes):
+        """
+           Content hash -> stored summary for the hashes present in the store
+        """
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, summary FROM summaries WHERE hash IN ({placeholders})", chunk
+                )
+                found.update(rows.fetchall())
+        return found
+
+    def embeddings_for_hashes(self, hashes):
+        """
+           Content hash -> stored summary embedding for the hashes present in the store
+        """
+        if self.format_version < 3:
+            return {}
+        hashes = list(hashes)
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), 500):
+                chunk = hashes[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT hash, embedding FROM summaries WHERE embedding IS NOT NULL AND hash IN ({placeholders})",
+                    chunk,
+                )
+                for summary_hash, embedding in rows:
+                    found[summary_hash] = np.frombuffer(embedding, dtype=np.float32)
+        return found
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
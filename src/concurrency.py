@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """
+       Rough token estimate (~4 characters per token for English text)
+    """
+    return len(text) // 4 + 1
+
+
+class RateLimiter:
+    """
+    Async token-bucket limiter for request-per-minute and token-per-minute quotas.
+    Either quota may be None to leave it unlimited.
+    """
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = float(requests_per_minute or 0)
+        self._tokens = float(tokens_per_minute or 0)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self._updated) / 60
+        self._updated = now
+        if self.requests_per_minute:
+            self._requests = min(self.requests_per_minute, self._requests + elapsed_minutes * self.requests_per_minute)
+        if self.tokens_per_minute:
+            self._tokens = min(self.tokens_per_minute, self._tokens + elapsed_minutes * self.tokens_per_minute)
+
+    async def acquire(self, tokens=0):
+        """
+           Wait until one request and `tokens` tokens are available, then take them
+        """
+        if self.tokens_per_minute:
+            # A single oversized request must still be able to run eventually
+            tokens = min(tokens, self.tokens_per_minute)
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.requests_per_minute and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) / self.requests_per_minute * 60)
+                if self.tokens_per_minute and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) / self.tokens_per_minute * 60)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests_per_minute:
+                self._requests -= 1
+            if self.tokens_per_minute:
+                self._tokens -= tokens
+
+
+async def run_bounded(items, fn, max_concurrency=8, limiter=None, token_cost=None,
+                      max_retries=5, backoff=1.0, retryable=None, progress=None, description="tasks",
+                      return_exceptions=False):
+    """
+       Run the coroutine function fn over items with bounded concurrency.
+
+       Args:
+           items: Inputs, one call of fn each
+           fn: Coroutine function taking one item
+           max_concurrency: Maximum calls in flight
+           limiter: Optional RateLimiter applied before every attempt
+           token_cost: Optional function estimating an item's tokens for the limiter
+           max_retries: Retries per item, with exponential backoff and jitter
+           retryable: Optional predicate on an exception; errors it rejects are raised at once
+           progress: Optional callback(done, total); progress is logged otherwise
+           return_exceptions: Return the final error of a failed item in its place instead
+               of raising it, so one failure does not discard the other results
+
+       Returns:
+           list: Results in the same order as items
+    """
+    items = list(items)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    total = len(items)
+    done = 0
+
+    async def call(item):
+        nonlocal done
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                if limiter is not None:
+                    await limiter.acquire(token_cost(item) if token_cost else 0)
+                try:
+                    result = await fn(item)
+                    break
+                except Exception as e:
+                    if attempt == max_retries or (retryable is not None and not retryable(e)):
+                        raise
+                    delay = backoff * (2 ** attempt) * (1 + random.random())
+                    logger.warning(f"Call failed ({e}), retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+        done += 1
+        if progress is not None:
+            progress(done, total)
+        elif done == total or done % max(1, total // 20) == 0:
+            logger.info(f"Completed {done}/{total} {description}")
+        return result
+
+    return await asyncio.gather(*[call(item) for item in items], return_exceptions=return_exceptions)
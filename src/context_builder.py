@@ -0,0 +1,82 @@
+from dataclasses import dataclass, field
+import tiktoken
+
+
+@dataclass
+class PackedContext:
+    """
+    Summaries selected for a prompt, in prompt order, with token accounting.
+    """
+    summaries: list = field(default_factory=list)
+    used_tokens: int = 0
+    dropped_tokens: int = 0
+    dropped_count: int = 0
+    level: int = None
+
+
+class ContextBuilder:
+    """
+    Ranks community summaries by the relevance of the entities that pulled them in
+    and packs them into a fixed token budget in a deterministic order.
+    """
+
+    def __init__(self, token_budget=3000, model="gpt-4o-mini"):
+        self.token_budget = token_budget
+        self.encoding = tiktoken.encoding_for_model(model)
+
+    def count_tokens(self, text):
+        return len(self.encoding.encode(text))
+
+    def rank(self, scored_entities, summarizer, level=None):
+        """
+           Score each summary by the summed scores of the entities that pulled it in.
+
+           Args:
+               scored_entities: (entity, score) pairs from retrieval
+               summarizer: CommunitySummarizer used to look up entity summaries
+               level: Community level to draw summaries from (None for every level)
+
+           Returns:
+               list: Unique summaries, highest score first; ties broken by text
+        """
+        scores = {}
+        for entity, score in scored_entities:
+            for summary in summarizer.get_summaries_for_entity(entity.name, level):
+                scores[summary] = scores.get(summary, 0.0) + score
+        return sorted(scores, key=lambda summary: (-scores[summary], summary))
+
+    def pack(self, summaries, token_budget=None):
+        """
+           Greedily keep ranked summaries that fit within the token budget
+        """
+        token_budget = token_budget or self.token_budget
+        packed = PackedContext()
+        for summary in summaries:
+            tokens = self.count_tokens(summary)
+            if packed.used_tokens + tokens <= token_budget:
+                packed.summaries.append(summary)
+                packed.used_tokens += tokens
+            else:
+                packed.dropped_tokens += tokens
+                packed.dropped_count += 1
+        return packed
+
+    def build(self, scored_entities, summarizer, token_budget=None):
+        """
+           Rank and pack summaries, choosing the community level per query.
+
+           Starting from the finest level, the first level whose ranked summaries fit
+           the budget is used; if none fit, the coarsest level is packed. Summarizers
+           without a stored hierarchy use summaries from every community.
+        """
+        token_budget = token_budget or self.token_budget
+        num_levels = summarizer.num_levels() if hasattr(summarizer, 'num_levels') else 0
+        if not num_levels:
+            return self.pack(self.rank(scored_entities, summarizer), token_budget)
+
+        for level in reversed(range(num_levels)):
+            ranked = self.rank(scored_entities, summarizer, level)
+            if level == 0 or sum(self.count_tokens(s) for s in ranked) <= token_budget:
+                packed = self.pack(ranked, token_budget)
+                packed.level = level
+                return packed
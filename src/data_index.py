@@ -1,10 +1,21 @@
 from llama_index.graph_stores.neo4j import Neo4jPropertyGraphStore
 from llama_index.core.vector_stores.types import VectorStoreQuery
-from openai import OpenAI
+from llama_index.core.graph_stores.types import EntityNode
+from openai import OpenAI, AsyncOpenAI
+from neo4j import AsyncGraphDatabase
 from data_models import EntityModel
+from cache import EmbeddingCache, SynonymCache
+from vector_index import EntityVectorIndex
+from batch_embedder import BatchEmbedder
+from graph_snapshot import AdjacencySnapshot
 import os
 from dotenv import load_dotenv
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import lru_cache
 import logging
+import time
+import uuid
 from typing import List
 
 # Set up logging
@@ -14,6 +25,107 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Bounded neighbourhood expansion, one hop at a time from every seed at once.
+# Each frontier node contributes at most $max_per_node distinct neighbours, so the
+# traversal itself (not just the result) is capped no matter how dense hubs get;
+# each neighbour is returned once per seed at its shortest hop count
+expansion_hop = """
+CALL {
+    WITH visited, frontier
+    UNWIND frontier AS node
+    CALL {
+        WITH node
+        MATCH (node)-[r]-(nbr:__Entity__)
+        WHERE $rel_labels IS NULL OR type(r) IN $rel_labels
+        WITH DISTINCT nbr
+        LIMIT $max_per_node
+        RETURN nbr
+    }
+    WITH DISTINCT nbr
+    WHERE NOT nbr IN visited
+    RETURN collect(nbr) AS next_frontier
+}
+WITH seed_id, visited + next_frontier AS visited, next_frontier AS frontier, layers + [next_frontier] AS layers
+"""
+
+@lru_cache(maxsize=None)
+def expansion_query(depth):
+    """
+       Cypher for a neighbourhood expansion of `depth` hops
+    """
+    return (
+        """
+UNWIND $seeds AS seed_id
+MATCH (seed:__Entity__ {id: seed_id})
+WITH seed_id, [seed] AS visited, [seed] AS frontier, [] AS layers
+"""
+        + expansion_hop * int(depth)
+        + """
+UNWIND range(1, size(layers)) AS hops
+UNWIND layers[hops - 1] AS nbr
+RETURN seed_id, nbr.id AS name,
+       [l IN labels(nbr) WHERE NOT l IN ['__Entity__', '__Node__']][0] AS label,
+       nbr {.*, embedding: null} AS properties, hops
+"""
+    )
+
+def reciprocal_rank_fusion(ranked_lists, k=60):
+    """
+       Fuse ranked node lists with reciprocal rank fusion.
+
+       Returns:
+           list: (node, score) pairs sorted by fused score, one per node name
+    """
+    fused = {}
+    for ranked in ranked_lists:
+        seen = set()
+        for rank, node in enumerate(ranked):
+            if node.name in seen:
+                continue
+            seen.add(node.name)
+            score = 1.0 / (k + rank + 1)
+            if node.name in fused:
+                fused[node.name] = (fused[node.name][0], fused[node.name][1] + score)
+            else:
+                fused[node.name] = (node, score)
+    return sorted(fused.values(), key=lambda pair: pair[1], reverse=True)
+
+# Async-path equivalents of the graph store's vector and id lookups
+vector_similarity_query = """
+MATCH (e:__Entity__)
+WHERE e.embedding IS NOT NULL AND size(e.embedding) = $dimension
+WITH e, vector.similarity.cosine(e.embedding, $embedding) AS score
+ORDER BY score DESC LIMIT toInteger($limit)
+RETURN e.id AS name,
+       [l IN labels(e) WHERE NOT l IN ['__Entity__', '__Node__']][0] AS label,
+       e {.*, embedding: null} AS properties, score
+"""
+
+# Vector similarity for many query embeddings in one round trip
+batch_vector_similarity_query = """
+UNWIND range(0, size($embeddings) - 1) AS query_index
+CALL {
+    WITH query_index
+    MATCH (e:__Entity__)
+    WHERE e.embedding IS NOT NULL AND size(e.embedding) = $dimension
+    WITH e, vector.similarity.cosine(e.embedding, $embeddings[query_index]) AS score
+    ORDER BY score DESC LIMIT toInteger($limit)
+    RETURN e, score
+}
+RETURN query_index, e.id AS name,
+       [l IN labels(e) WHERE NOT l IN ['__Entity__', '__Node__']][0] AS label,
+       e {.*, embedding: null} AS properties, score
+ORDER BY query_index, score DESC
+"""
+
+entities_by_id_query = """
+MATCH (e:__Entity__)
+WHERE e.id IN $ids
+RETURN e.id AS name,
+       [l IN labels(e) WHERE NOT l IN ['__Entity__', '__Node__']][0] AS label,
+       e {.*, embedding: null} AS properties
+"""
+
 # System prompt
 system_prompt = """
 Given some initial query, generate synonyms or related keywords up to 10 in total, considering possible cases of pluralization, common expressions, etc.
@@ -21,17 +133,72 @@ The resulting list should be a list of entity names used to index a graph databa
 """
 
 class DataIndexer:
-    def __init__(self):
+    def __init__(self, vector_timeout=None, keyword_timeout=None, use_local_index=False,
+                 index_path='entity_index', use_snapshot=False, snapshot_path='graph_snapshot',
+                 seed_top_k=20, top_k=30, depth=2, max_per_node=10):
         # Get credentials from environment variables
         self.neo4j_uri = os.getenv('NEO4J_URI')
         self.neo4j_username = os.getenv('NEO4J_USERNAME', 'neo4j')
         self.neo4j_password = os.getenv('NEO4J_PASSWORD')
         self.openai_api_key = os.getenv('OPENAI_API_KEY')
+        # Bounds on single blocking calls, so an abandoned retrieval branch always finishes
+        self.openai_timeout = float(os.getenv('OPENAI_TIMEOUT', 60))
+        neo4j_timeout = os.getenv('NEO4J_QUERY_TIMEOUT')
+        self.neo4j_timeout = float(neo4j_timeout) if neo4j_timeout else None
 
         # Initialize OpenAI client
         if not self.openai_api_key:
             raise ValueError("OpenAI API key not found")
-        self.client = OpenAI(api_key=self.openai_api_key)
+        self.client = OpenAI(api_key=self.openai_api_key, timeout=self.openai_timeout)
+        self.aclient = AsyncOpenAI(api_key=self.openai_api_key, timeout=self.openai_timeout)
+        # Optional AsyncMicroBatcher coalescing async embedding calls across requests
+        self.embedding_batcher = None
+
+        # Embedding cache (in-memory LRU plus optional on-disk store)
+        self.embedding_model = "text-embedding-3-small"
+        self.embedding_cache = EmbeddingCache(
+            maxsize=int(os.getenv('EMBEDDING_CACHE_SIZE', 4096)),
+            path=os.getenv('EMBEDDING_CACHE_PATH'),
+        )
+        # Batched, concurrent embedding requests with per-batch retries
+        self.embedder = BatchEmbedder(
+            self.client,
+            model=self.embedding_model,
+            max_workers=int(os.getenv('EMBEDDING_WORKERS', 4)),
+            aclient=self.aclient,
+        )
+
+        # Synonym expansion cache (avoids repeating the GPT-4 call per query)
+        synonym_ttl = os.getenv('SYNONYM_CACHE_TTL')
+        self.synonym_cache = SynonymCache(
+            maxsize=int(os.getenv('SYNONYM_CACHE_SIZE', 1024)),
+            ttl=float(synonym_ttl) if synonym_ttl else None,
+            path=os.getenv('SYNONYM_CACHE_PATH'),
+        )
+
+        # Optional in-process mirror of the Neo4j entity vector index
+        self.index_path = index_path
+        self.use_local_index = use_local_index
+        self.vector_index = None
+
+        # Per-branch retrieval timeouts in seconds (None waits indefinitely)
+        self.vector_timeout = vector_timeout
+        self.keyword_timeout = keyword_timeout
+        # Fused seeds kept before expansion, and final nodes kept after it
+        self.seed_top_k = seed_top_k
+        self.top_k = top_k
+        # Neighbourhood expansion shared by every retrieval path: hops from each seed
+        # and neighbours taken from each expanded node
+        self.depth = depth
+        self.max_per_node = max_per_node
+        # Pool for the vector and keyword branches of retrieve_scored. It is separate from
+        # the work pool and sized so that branches abandoned after a timeout (which keep
+        # running until their client call returns) do not starve later retrievals
+        self.branch_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('RETRIEVAL_BRANCH_WORKERS', 32)), thread_name_prefix="branch"
+        )
+        # Work pool for ingestion pipelining and batch retrieval
+        self.executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieve")
 
         # Initialize Neo4j connection
         try:
@@ -39,12 +206,67 @@ class DataIndexer:
                 username=self.neo4j_username,
                 password=self.neo4j_password,
                 url=self.neo4j_uri,
+                timeout=self.neo4j_timeout,
             )
             logger.info("Successfully connected to Neo4j Aura")
             self._verify_connection()
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {e}")
             raise
+        # Async driver for the async retrieval path (connects lazily)
+        self.async_driver = AsyncGraphDatabase.driver(
+            self.neo4j_uri, auth=(self.neo4j_username, self.neo4j_password)
+        )
+
+        # Optional local adjacency snapshot for neighbourhood expansion
+        self.snapshot_path = snapshot_path
+        self.use_snapshot = use_snapshot
+        self.snapshot = None
+        if use_local_index or use_snapshot:
+            self.refresh_local_indexes(self.graph_version())
+
+    def graph_version(self):
+        """
+           Version id written to Neo4j by the last ingestion
+        """
+        records = self.graph_store.structured_query(
+            "MATCH (v:__GraphVersion__ {key: 'graph'}) RETURN v.version AS version"
+        )
+        return records[0]["version"] if records else None
+
+    def refresh_local_indexes(self, version):
+        """
+           Bring the local entity index and adjacency snapshot in line with graph `version`.
+           Each is reloaded from disk when it is missing or from another build, and
+           dropped (falling back to Neo4j) when the files on disk are stale too.
+           Each is replaced with a single assignment, so concurrent readers see either
+           the old or the new index.
+        """
+        if self.use_local_index and (self.vector_index is None or self.vector_index.version != version):
+            vector_index = None
+            if EntityVectorIndex.exists(self.index_path):
+                vector_index = EntityVectorIndex.load(self.index_path)
+                if vector_index.version != version:
+                    logger.warning(
+                        f"Ignoring stale local entity index (index {vector_index.version}, graph {version})"
+                    )
+                    vector_index = None
+                else:
+                    logger.info(f"Loaded local entity index with {len(vector_index)} entities")
+            self.vector_index = vector_index
+
+        if self.use_snapshot and (self.snapshot is None or self.snapshot.version != version):
+            snapshot = None
+            if AdjacencySnapshot.exists(self.snapshot_path):
+                snapshot = AdjacencySnapshot.load(self.snapshot_path)
+                if snapshot.version != version:
+                    logger.warning(
+                        f"Ignoring stale graph snapshot (snapshot {snapshot.version}, graph {version})"
+                    )
+                    snapshot = None
+                else:
+                    logger.info(f"Loaded graph snapshot with {len(snapshot)} nodes")
+            self.snapshot = snapshot
 
     def _verify_connection(self):
         """
@@ -60,45 +282,114 @@ class DataIndexer:
 
     def get_embeddings(self, texts: List[str]):
         """  
-           Get embeddings from OpenAI
+           Get embeddings from OpenAI, serving repeated texts from the embedding cache
         """
         try:
-            data = self.client.embeddings.create(
-                input=texts,
-                model="text-embedding-3-small"
-            ).data
-            embeddings = [d.embedding for d in data]
+            cached = self.embedding_cache.get_many(self.embedding_model, texts)
+            missing = [i for i in range(len(texts)) if i not in cached]
+
+            if missing:
+                # Embed each distinct missing text only once
+                unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+                new_embeddings = self.embedder.embed(unique_texts)
+                self.embedding_cache.set_many(self.embedding_model, unique_texts, new_embeddings)
+
+                by_text = dict(zip(unique_texts, new_embeddings))
+                for i in missing:
+                    cached[i] = by_text[texts[i]]
+
+            embeddings = [cached[i] for i in range(len(texts))]
             
             return embeddings
         except Exception as e:
             raise
 
+    def embedding_cache_stats(self):
+        """
+           Hit/miss counters of the embedding cache
+        """
+        return self.embedding_cache.stats()
+
     def vector_search(self, query: str, similarity_top_k=10):
         """ 
-           Perform vector similarity search 
+           Perform vector similarity search, using the local index when loaded
         """
 
         try:
             logger.info(f"Performing vector search for: {query}")
             # Get query embedding
             embedding = self.get_embeddings([query])[0]
-            
-            # Create vector store query
-            vector_query = VectorStoreQuery(
-                query_embedding=embedding,
-                similarity_top_k=similarity_top_k
-            )
-            
-            # Execute search
-            results = self.graph_store.vector_query(vector_query)
-            nodes = results[0] if results else []
-            
-            return nodes
+
+            if self.vector_index is not None:
+                nodes, _ = self.vector_index.query(embedding, similarity_top_k)
+                return nodes
+
+            return self._neo4j_vector_query(embedding, similarity_top_k)
         except Exception as e:
             logger.error(f"Vector search error: {e}")
             return []
 
+    def _neo4j_vector_query(self, embedding, similarity_top_k=10):
+        """
+           Run a vector similarity query against Neo4j
+        """
+        # Create vector store query
+        vector_query = VectorStoreQuery(
+            query_embedding=embedding,
+            similarity_top_k=similarity_top_k
+        )
+        
+        # Execute search
+        results = self.graph_store.vector_query(vector_query)
+        nodes = results[0] if results else []
+        
+        return nodes
+
+    def check_local_index_recall(self, queries: List[str], similarity_top_k=10):
+        """
+           Compare the local index against Neo4j vector search.
+
+           Returns:
+               float: Mean recall@k of the local index, using Neo4j results as ground truth
+        """
+        if self.vector_index is None:
+            raise ValueError("Local entity index is not loaded")
+
+        recalls = []
+        for embedding in self.get_embeddings(queries):
+            expected = {n.name for n in self._neo4j_vector_query(embedding, similarity_top_k)}
+            if not expected:
+                continue
+            nodes, _ = self.vector_index.query(embedding, similarity_top_k)
+            recalls.append(len(expected & {n.name for n in nodes}) / len(expected))
+
+        recall = sum(recalls) / len(recalls) if recalls else 0.0
+        logger.info(f"Local index recall@{similarity_top_k}: {recall:.3f} over {len(recalls)} queries")
+        return recall
+
     def get_synonyms(self, query: str):
+        """
+           Generate synonyms using GPT-4, memoized per normalized query
+        """
+        return self.synonym_cache.get_or_compute(query, lambda: self._generate_synonyms(query))
+
+    def _synonym_messages(self, query: str):
+        """
+           Chat messages asking for synonyms of the query
+        """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"QUERY: {query}"}
+        ]
+
+    def _parse_synonyms(self, completion):
+        """
+           Extract the comma-separated keywords from a synonym completion
+        """
+        response_text = completion.choices[0].message.content
+        return [k.strip().capitalize() for k in response_text.split(',')]
+
+    def _generate_synonyms(self, query: str):
         """
            Generate synonyms using GPT-4
         """
@@ -107,17 +398,11 @@ class DataIndexer:
             
             completion = self.client.chat.completions.create(
                 model="gpt-4",  
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": f"QUERY: {query}"}
-                ]
+                messages=self._synonym_messages(query),
             )
             
             # Extract keywords from response
-            response_text = completion.choices[0].message.content
-            keywords = [k.strip().capitalize() for k in response_text.split(',')]
-            
-            return keywords
+            return self._parse_synonyms(completion)
         except Exception as e:
             logger.error(f"Error generating synonyms: {e}")
             return []
@@ -132,70 +417,502 @@ class DataIndexer:
             if not keywords:
                 return []
             
-            nodes = self.graph_store.get(ids=keywords)
-            return nodes
+            return self._rank_by_keywords(self.graph_store.get(ids=keywords), keywords)
         except Exception as e:
             logger.error(f"Keyword search error: {e}")
             return []
 
-    def get_related_nodes(self, nodes):
+    def _rank_by_keywords(self, nodes, keywords):
+        """
+           Order matched nodes by the rank of their synonym (graph lookups return
+           them in database order, which reciprocal rank fusion would treat as a ranking)
+        """
+        nodes_by_name = {node.name: node for node in nodes}
+        return [nodes_by_name[k] for k in dict.fromkeys(keywords) if k in nodes_by_name]
+
+    def expand_neighbourhood(self, nodes, depth=None, max_per_node=None, limit=50,
+                             rel_labels=None, seed_scores=None):
+        """
+           Expand seed nodes into a scored, capped graph neighbourhood in one query.
+
+           Args:
+               nodes: Seed entity nodes
+               depth: Maximum number of hops from a seed (defaults to self.depth)
+               max_per_node: Maximum neighbours taken from each expanded node
+                   (defaults to self.max_per_node)
+               limit: Maximum size of the returned neighbourhood (seeds included)
+               rel_labels: Only traverse relationships with these labels (None for all)
+               seed_scores: Optional name -> score for seeds (defaults to 1.0)
+
+           Returns:
+               list: (EntityNode, score) pairs sorted by score; a neighbour scores
+               its best seed score divided by (1 + hops)
+        """
+        scored = self._seed_scores(nodes, seed_scores)
+        if not scored:
+            return []
+
+        records = self._expansion_records(list(scored), depth, max_per_node, rel_labels)
+        return self._score_records(scored, records, limit)
+
+    def _seed_scores(self, nodes, seed_scores=None):
+        """
+           Map seed names to (node, score), defaulting scores to 1.0
+        """
+        seed_scores = seed_scores or {}
+        scored = {}
+        for node in nodes:
+            score = seed_scores.get(node.name, 1.0)
+            if node.name not in scored or scored[node.name][1] < score:
+                scored[node.name] = (node, score)
+        return scored
+
+    def _expansion_params(self, depth=None, max_per_node=None):
+        """
+           Expansion depth and per-node fan-out, falling back to the indexer defaults
+        """
+        return (
+            self.depth if depth is None else depth,
+            self.max_per_node if max_per_node is None else max_per_node,
+        )
+
+    def _expansion_records(self, seed_names, depth=None, max_per_node=None, rel_labels=None):
+        """
+           Neighbour records for the seeds, from the local snapshot when loaded
+        """
+        depth, max_per_node = self._expansion_params(depth, max_per_node)
+        if self.snapshot is not None:
+            return self.snapshot.expand(seed_names, depth, max_per_node, rel_labels)
+
+        return self.graph_store.structured_query(
+            expansion_query(depth),
+            param_map={
+                "seeds": seed_names,
+                "rel_labels": list(rel_labels) if rel_labels else None,
+                "max_per_node": max_per_node,
+            },
+        )
+
+    def _node_from_record(self, record):
+        """
+           Build an EntityNode from a Cypher record with name, label and properties
+        """
+        properties = {
+            k: v for k, v in (record["properties"] or {}).items()
+            if k not in ("id", "name", "embedding")
+        }
+        return EntityNode(name=record["name"], label=record["label"] or "entity", properties=properties)
+
+    def _score_records(self, scored, records, limit):
+        """
+           Merge neighbour records into the scored seeds and keep the best `limit`
+        """
+        # Deduplicate while streaming, keeping each neighbour's best score
+        for record in records:
+            seed = scored.get(record["seed_id"])
+            if seed is None:
+                continue
+            name = record["name"]
+            score = seed[1] / (1 + record["hops"])
+            if name in scored and scored[name][1] >= score:
+                continue
+            scored[name] = (self._node_from_record(record), score)
+
+        ranked = sorted(scored.values(), key=lambda pair: pair[1], reverse=True)
+        return ranked[:limit]
+
+    def get_related_nodes(self, nodes, **expansion):
         """ 
            Get related nodes from the graph 
         """
         try:
             if not nodes:
                 return []
-                
-            triplets = self.graph_store.get_rel_map(nodes)
-            related_nodes = []
-            
-            for triplet in triplets:
-                related_nodes.extend([triplet[0], triplet[-1]])
-            return related_nodes
+
+            return [node for node, _ in self.expand_neighbourhood(nodes, **expansion)]
         except Exception as e:
             logger.error(f"Error getting related nodes: {e}")
             return []
 
-    def retrieve(self, query: str):
+    def _branch_result(self, future, deadline, branch):
         """
-           Retrieve nodes using both vector and keyword search
+           Wait for a retrieval branch until its deadline, returning [] on timeout.
+           A branch that is already running cannot be cancelled; it is abandoned and
+           its worker is freed once the (timeout-bounded) client call returns.
+        """
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            logger.warning(f"{branch} search timed out, continuing without it")
+            future.cancel()
+            return []
+
+    def _fused_seeds(self, nodes_from_vector, nodes_from_keywords, seed_top_k=None):
+        """
+           Fuse both branches with reciprocal rank fusion and keep the best seeds.
+
+           Returns:
+               dict: Seed name -> (node, fused score)
+        """
+        seeds = reciprocal_rank_fusion([nodes_from_vector, nodes_from_keywords])[:seed_top_k or self.seed_top_k]
+        return self._seed_scores(
+            [node for node, _ in seeds], {node.name: score for node, score in seeds}
+        )
+
+    def rank_and_expand(self, nodes_from_vector, nodes_from_keywords, seed_top_k=None, top_k=None):
+        """
+           Fuse both branches with reciprocal rank fusion, keep the best seeds,
+           expand them with score propagation and keep the final top_k.
+
+           Returns:
+               list: (node, score) pairs sorted by score
+        """
+        scored = self._fused_seeds(nodes_from_vector, nodes_from_keywords, seed_top_k)
+        if not scored:
+            return []
+
+        # Graph neighbours inherit their seed's fused score, discounted by distance
+        records = self._expansion_records(list(scored))
+        return self._score_records(scored, records, top_k or self.top_k)
+
+    def retrieve_scored(self, query: str, vector_timeout=None, keyword_timeout=None,
+                        seed_top_k=None, top_k=None):
+        """
+           Retrieve scored nodes using both vector and keyword search.
+           Both branches run concurrently; a branch exceeding its timeout
+           contributes no nodes instead of failing the whole retrieval.
+
+           Returns:
+               list: (node, score) pairs, most relevant first
         """
         try:
             logger.info(f"Starting retrieval for query: {query}")
-            
-            # Get nodes from both methods
-            nodes_from_vector = self.vector_search(query)
-            nodes_from_keywords = self.keyword_search(query)
-            
-            # Get related nodes
-            all_nodes = nodes_from_vector + nodes_from_keywords
-            nodes = self.get_related_nodes(all_nodes)
-            
-            # Remove duplicates
-            nodes_dict = {n.name: n for n in nodes}
-            final_nodes = list(nodes_dict.values())
-            return final_nodes
+            vector_timeout = vector_timeout if vector_timeout is not None else self.vector_timeout
+            keyword_timeout = keyword_timeout if keyword_timeout is not None else self.keyword_timeout
+
+            # Fan out both methods at the same time
+            start = time.monotonic()
+            vector_future = self.branch_executor.submit(self.vector_search, query)
+            keyword_future = self.branch_executor.submit(self.keyword_search, query)
+
+            nodes_from_vector = self._branch_result(
+                vector_future, None if vector_timeout is None else start + vector_timeout, "Vector"
+            )
+            nodes_from_keywords = self._branch_result(
+                keyword_future, None if keyword_timeout is None else start + keyword_timeout, "Keyword"
+            )
+
+            return self.rank_and_expand(nodes_from_vector, nodes_from_keywords, seed_top_k, top_k)
         except Exception as e:
             logger.error(f"Error in retrieve: {e}")
             return []
 
-    def insert_data(self, entities, relationships):
+    def retrieve(self, query: str, **kwargs):
         """
-           Insert data into Neo4j Aura
+           Retrieve nodes using both vector and keyword search, most relevant first
         """
+        return [node for node, _ in self.retrieve_scored(query, **kwargs)]
 
+    def _batch_vector_search(self, embeddings, similarity_top_k=10):
+        """
+           Vector search for many query embeddings at once
+           (one matrix product with the local index, one UNWIND query otherwise)
+        """
+        if self.vector_index is not None:
+            return [
+                [self.vector_index.get_node(i) for i in indices]
+                for indices, _ in self.vector_index.search(embeddings, similarity_top_k)
+            ]
+
+        if not embeddings:
+            return []
         try:
-            # Generate embeddings
-            texts_index = [str(entity) for entity in entities]
-            embeddings = self.get_embeddings(texts_index)
-            
-            # Add embeddings to entities
-            for entity, embedding in zip(entities, embeddings):
-                entity.embedding = embedding
-            
-            # Insert into graph store
-            self.graph_store.upsert_nodes(entities)
-            self.graph_store.upsert_relations(relationships)
+            records = self.graph_store.structured_query(
+                batch_vector_similarity_query,
+                param_map={
+                    "embeddings": embeddings,
+                    "dimension": len(embeddings[0]),
+                    "limit": similarity_top_k,
+                },
+            )
+        except Exception as e:
+            logger.error(f"Vector search error: {e}")
+            return [[] for _ in embeddings]
+
+        results = [[] for _ in embeddings]
+        for record in records:
+            results[record["query_index"]].append(self._node_from_record(record))
+        return results
+
+    def _batch_keyword_search(self, queries):
+        """
+           Keyword search for many queries with a single graph lookup.
+           Must be called from outside self.executor, since it fans the synonym
+           generation out onto that pool and waits for it.
+        """
+        keywords_per_query = list(self.executor.map(self.get_synonyms, queries))
+        all_keywords = list(dict.fromkeys(k for keywords in keywords_per_query for k in keywords))
+        if not all_keywords:
+            return [[] for _ in queries]
+
+        try:
+            nodes = self.graph_store.get(ids=all_keywords)
+        except Exception as e:
+            logger.error(f"Keyword search error: {e}")
+            return [[] for _ in queries]
+        return [self._rank_by_keywords(nodes, keywords) for keywords in keywords_per_query]
+
+    def retrieve_many_scored(self, queries: List[str], similarity_top_k=10, seed_top_k=None, top_k=None,
+                             depth=None, max_per_node=None):
+        """
+           Retrieve scored nodes for many queries at once.
+
+           Process:
+           1. Embed all queries in one batched get_embeddings call
+           2. Run the vector lookups together (one matrix product with the local index,
+              or one UNWIND query against Neo4j)
+           3. Expand the union of every query's fused seeds once
+           4. Score each query's neighbourhood from the shared expansion records
+
+           Returns:
+               list: For each query, (node, score) pairs most relevant first
+        """
+        try:
+            top_k = top_k or self.top_k
+            logger.info(f"Starting batch retrieval for {len(queries)} queries")
+
+            # The vector branch never waits on the pool itself, so it can run there while
+            # the keyword branch fans its synonym calls out from this thread
+            vector_future = self.executor.submit(
+                lambda: self._batch_vector_search(self.get_embeddings(queries), similarity_top_k)
+            )
+            keyword_results = self._batch_keyword_search(queries)
+            vector_results = vector_future.result()
+
+            seeds_per_query = [
+                self._fused_seeds(from_vector, from_keywords, seed_top_k)
+                for from_vector, from_keywords in zip(vector_results, keyword_results)
+            ]
+
+            # Coalesce expansion of overlapping seeds across queries
+            all_seeds = list(dict.fromkeys(name for scored in seeds_per_query for name in scored))
+            records_by_seed = {}
+            if all_seeds:
+                for record in self._expansion_records(all_seeds, depth, max_per_node):
+                    records_by_seed.setdefault(record["seed_id"], []).append(record)
+
+            results = []
+            for scored in seeds_per_query:
+                records = [r for name in list(scored) for r in records_by_seed.get(name, [])]
+                results.append(self._score_records(scored, records, top_k))
+            return results
+        except Exception as e:
+            logger.error(f"Error in retrieve_many: {e}")
+            return [[] for _ in queries]
+
+    def retrieve_many(self, queries: List[str], **kwargs):
+        """
+           Retrieve nodes for many queries at once, most relevant first per query
+        """
+        return [[node for node, _ in scored] for scored in self.retrieve_many_scored(queries, **kwargs)]
+
+    async def _arun_query(self, query, params=None):
+        """
+           Run a Cypher query on the async driver and return records as dicts
+        """
+        records, _, _ = await self.async_driver.execute_query(query, parameters_=params or {})
+        return [record.data() for record in records]
+
+    async def _aexpansion_records(self, seed_names, depth=None, max_per_node=None, rel_labels=None):
+        """
+           Async counterpart of _expansion_records
+        """
+        depth, max_per_node = self._expansion_params(depth, max_per_node)
+        if self.snapshot is not None:
+            return list(self.snapshot.expand(seed_names, depth, max_per_node, rel_labels))
+
+        return await self._arun_query(
+            expansion_query(depth),
+            {
+                "seeds": seed_names,
+                "rel_labels": list(rel_labels) if rel_labels else None,
+                "max_per_node": max_per_node,
+            },
+        )
+
+    async def aget_embeddings(self, texts: List[str]):
+        """
+           Async counterpart of get_embeddings, sharing the embedding cache
+        """
+        cached = self.embedding_cache.get_many(self.embedding_model, texts)
+        missing = [i for i in range(len(texts)) if i not in cached]
+
+        if missing:
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            if self.embedding_batcher is not None:
+                new_embeddings = await self.embedding_batcher.embed(unique_texts)
+            else:
+                new_embeddings = await self.embedder.aembed(unique_texts)
+            self.embedding_cache.set_many(self.embedding_model, unique_texts, new_embeddings)
+
+            by_text = dict(zip(unique_texts, new_embeddings))
+            for i in missing:
+                cached[i] = by_text[texts[i]]
+
+        return [cached[i] for i in range(len(texts))]
+
+    async def avector_search(self, query: str, similarity_top_k=10):
+        """
+           Async counterpart of vector_search
+        """
+        try:
+            embedding = (await self.aget_embeddings([query]))[0]
+
+            if self.vector_index is not None:
+                nodes, _ = self.vector_index.query(embedding, similarity_top_k)
+                return nodes
+
+            records = await self._arun_query(
+                vector_similarity_query,
+                {"embedding": embedding, "dimension": len(embedding), "limit": similarity_top_k},
+            )
+            return [self._node_from_record(record) for record in records]
+        except Exception as e:
+            logger.error(f"Vector search error: {e}")
+            return []
+
+    async def aget_synonyms(self, query: str):
+        """
+           Async counterpart of get_synonyms, sharing the synonym cache
+        """
+        return await self.synonym_cache.aget_or_compute(query, lambda: self._agenerate_synonyms(query))
+
+    async def _agenerate_synonyms(self, query: str):
+        """
+           Async counterpart of _generate_synonyms
+        """
+        try:
+            completion = await self.aclient.chat.completions.create(
+                model="gpt-4",
+                messages=self._synonym_messages(query),
+            )
+            return self._parse_synonyms(completion)
+        except Exception as e:
+            logger.error(f"Error generating synonyms: {e}")
+            return []
+
+    async def akeyword_search(self, query: str):
+        """
+           Async counterpart of keyword_search
+        """
+        try:
+            keywords = await self.aget_synonyms(query)
+            if not keywords:
+                return []
+
+            records = await self._arun_query(entities_by_id_query, {"ids": keywords})
+            return self._rank_by_keywords([self._node_from_record(record) for record in records], keywords)
+        except Exception as e:
+            logger.error(f"Keyword search error: {e}")
+            return []
+
+    async def _abranch_result(self, coroutine, timeout, branch):
+        try:
+            return await asyncio.wait_for(coroutine, timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{branch} search timed out, continuing without it")
+            return []
+
+    async def aretrieve_scored(self, query: str, vector_timeout=None, keyword_timeout=None,
+                               seed_top_k=None, top_k=None):
+        """
+           Async counterpart of retrieve_scored
+        """
+        try:
+            logger.info(f"Starting async retrieval for query: {query}")
+            vector_timeout = vector_timeout if vector_timeout is not None else self.vector_timeout
+            keyword_timeout = keyword_timeout if keyword_timeout is not None else self.keyword_timeout
+            nodes_from_vector, nodes_from_keywords = await asyncio.gather(
+                self._abranch_result(self.avector_search(query), vector_timeout, "Vector"),
+                self._abranch_result(self.akeyword_search(query), keyword_timeout, "Keyword"),
+            )
+
+            scored = self._fused_seeds(nodes_from_vector, nodes_from_keywords, seed_top_k)
+            if not scored:
+                return []
+
+            records = await self._aexpansion_records(list(scored))
+            return self._score_records(scored, records, top_k or self.top_k)
+        except Exception as e:
+            logger.error(f"Error in aretrieve: {e}")
+            return []
+
+    async def aretrieve(self, query: str, **kwargs):
+        """
+           Async counterpart of retrieve
+        """
+        return [node for node, _ in await self.aretrieve_scored(query, **kwargs)]
+
+    async def aclose(self):
+        await self.async_driver.close()
+        await self.aclient.close()
+
+    def insert_data(self, entities, relationships, batch_size=500):
+        """
+           Insert data into Neo4j Aura in bounded batches.
+           Embedding of the next entity batch overlaps with the write of the current one;
+           each upsert call is written by the graph store as one parameterized UNWIND statement.
+        """
+
+        try:
+            entity_batches = [entities[i:i + batch_size] for i in range(0, len(entities), batch_size)]
+            start = time.monotonic()
+
+            # Generate embeddings for the first batch, then pipeline the rest
+            next_embeddings = None
+            if entity_batches:
+                next_embeddings = self.executor.submit(
+                    self.get_embeddings, [str(entity) for entity in entity_batches[0]]
+                )
+            for n, batch in enumerate(entity_batches):
+                embeddings = next_embeddings.result()
+                if n + 1 < len(entity_batches):
+                    next_embeddings = self.executor.submit(
+                        self.get_embeddings, [str(entity) for entity in entity_batches[n + 1]]
+                    )
+
+                # Add embeddings to entities
+                for entity, embedding in zip(batch, embeddings):
+                    entity.embedding = embedding
+
+                # Insert into graph store
+                self.graph_store.upsert_nodes(batch)
+            node_time = time.monotonic() - start
+            logger.info(f"Inserted {len(entities)} nodes ({len(entities) / max(node_time, 1e-9):.0f} rows/s)")
+
+            start = time.monotonic()
+            for i in range(0, len(relationships), batch_size):
+                self.graph_store.upsert_relations(relationships[i:i + batch_size])
+            rel_time = time.monotonic() - start
+            logger.info(f"Inserted {len(relationships)} relations ({len(relationships) / max(rel_time, 1e-9):.0f} rows/s)")
+
+            # Save a local mirror of the entity embeddings and the adjacency snapshot,
+            # both stamped with a new graph version
+            version = uuid.uuid4().hex
+            vector_index = EntityVectorIndex.from_entities(entities, version=version)
+            vector_index.save(self.index_path)
+            if self.use_local_index:
+                self.vector_index = vector_index
+
+            snapshot = AdjacencySnapshot.from_graph(entities, relationships, version=version)
+            snapshot.save(self.snapshot_path)
+            self.graph_store.structured_query(
+                "MERGE (v:__GraphVersion__ {key: 'graph'}) SET v.version = $version",
+                param_map={"version": version},
+            )
+            if self.use_snapshot:
+                self.snapshot = snapshot
             
             # Refresh schema if needed
             if self.graph_store.supports_structured_queries:
@@ -204,4 +921,4 @@ class DataIndexer:
             logger.info("Successfully inserted data")
         except Exception as e:
             logger.error(f"Error inserting data: {e}")
-            raise
\ No newline at end of file
+            raise
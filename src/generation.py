@@ -1,13 +1,21 @@
-import nest_asyncio
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from dataclasses import dataclass, field, replace
+from context_builder import ContextBuilder
+from semantic_cache import SemanticCache
+from graph_communities import CommunitySummarizer
+import asyncio
+import logging
 import os
-
-nest_asyncio.apply()
+import threading
+import time
 from dotenv import load_dotenv
 load_dotenv()  
 
 openai_api_key= os.getenv('OPENAI_API_KEY')
 client = OpenAI(api_key=openai_api_key)
+async_client = AsyncOpenAI(api_key=openai_api_key)
+
+logger = logging.getLogger(__name__)
 
 system_prompt = """
 You are an assistant for question-answering tasks. Use the following pieces of retrieved context to answer the question. 
@@ -15,10 +23,39 @@ If you don't know the answer, just say that you don't know - I am an Insurance Q
 Provide the answer and References!
 """
 
+@dataclass
+class GenerationResult:
+    """
+    Everything produced for one question: the answer, the retrieved entities
+    and the community summaries used as context.
+    """
+    answer: str
+    entities: list = field(default_factory=list)
+    summaries: list = field(default_factory=list)
+    context_tokens: int = 0
+    dropped_tokens: int = 0
+    cached: bool = False
+
+
 class Generator:
-    def __init__(self, data_indexer, community_summarizer):
+    def __init__(self, data_indexer, community_summarizer, context_budget=3000,
+                 cache_size=1000, cache_threshold=0.95, global_top_k=10, version_check_interval=30):
         self.indexer = data_indexer
         self.summarizer = community_summarizer
+        self.context_builder = ContextBuilder(token_budget=context_budget)
+        # Summaries considered when answering directly from summary embeddings
+        self.global_top_k = global_top_k
+        # One answer cache per retrieval mode ("local" entity search, "global" summary search)
+        self.answer_caches = {
+            mode: SemanticCache(maxsize=cache_size, threshold=cache_threshold)
+            for mode in ("local", "global")
+        }
+        # Persisted community store and graph versions, re-read at most every
+        # version_check_interval seconds so rebuilds by another process are noticed
+        self.version_check_interval = version_check_interval
+        self._versions = None
+        self._versions_checked = 0.0
+        self._versions_lock = threading.Lock()
 
     def get_entities(self, query):
         """
@@ -51,7 +88,19 @@ class Generator:
         #Get entities related to the query
         entities = self.get_entities(query)
         #print(entities) 
+
+        return self.get_summaries_for_entities(entities)
+
+    def get_summaries_for_entities(self, entities):
+        """
+        Get the unique community summaries for already retrieved entities.
         
+        Args:
+            entities: Entities returned by get_entities
+            
+        Returns:
+            set: A set of unique summaries related to the entities
+        """
         all_summaries = set()
         
         # For each entity, get its community summaries
@@ -63,41 +112,275 @@ class Generator:
 
         return all_summaries
     
-    def generate(self, query):
+    def generate(self, query, mode="local"):
         """
         Generate a response to the query using retrieved context and GPT-4.
         
         Args:
             query (str): The user's query
+            mode (str): "local" (entity retrieval) or "global" (summary similarity)
+            
+        Returns:
+            str: The generated response from GPT-4
+        """
+        return self.answer(query, mode).answer
+
+    def retrieve_context(self, query, mode="local"):
+        """
+        Retrieve entities for the query and pack the community summaries they pull in.
+        
+        Args:
+            query (str): The user's query
+            mode (str): "local" for hybrid entity retrieval, "global" to rank
+                community summaries directly by embedding similarity
             
         Process:
-        1. Get community summaries for context
-        2. Combine summaries into a single context string
-        3. Use GPT-4 to generate a response based on the context
+        1. Retrieve scored entities for the query
+        2. Rank their community summaries by the entity scores
+        3. Pack the ranked summaries into the context token budget
         
         Returns:
-            str: The generated response from GPT-4
+            tuple: (entities, PackedContext)
+        """
+        if mode == "global":
+            return self.retrieve_global_context(query)
+
+        scored_entities = self.indexer.retrieve_scored(query)
+        entities = [entity for entity, _ in scored_entities]
+        context = self.context_builder.build(scored_entities, self.summarizer)
+        return entities, context
+
+    def retrieve_global_context(self, query):
         """
-        # Get relevant summaries for context
-        summaries = self.get_community_summaries(query)
+        Pack the community summaries most similar to the query, bypassing
+        entity retrieval and graph expansion.
         
+        Returns:
+            tuple: ([], PackedContext)
+        """
+        embedding = self.indexer.get_embeddings([query])[0]
+        ranked = self.summarizer.search_summaries(embedding, self.global_top_k)
+        return [], self.context_builder.pack([summary for summary, _ in ranked])
+
+    def build_messages(self, query, summaries):
+        """
+        Build the chat messages for the query with the summaries as context.
+        """
         context = "\n\n".join(summaries)
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"CONTEXT: {context}\n\nQUERY: {query}"},
+        ]
+
+    def refresh_versions(self):
+        """
+        Re-read the persisted versions of the community summaries and of the graph,
+        at most once per version_check_interval seconds. When the saved community
+        store has changed, the summarizer is reloaded from it; when the graph has
+        changed, the indexer's local entity index and snapshot are refreshed.
+        
+        Returns:
+            tuple: (community summaries version, graph version)
+        """
+        with self._versions_lock:
+            now = time.monotonic()
+            if self._versions is not None and now - self._versions_checked < self.version_check_interval:
+                return self._versions
+            self._versions_checked = now
+            summary_version, graph_version = self._versions or (self.summarizer.version, None)
+
+            try:
+                stored_version = self.summarizer.stored_version()
+                if stored_version != self.summarizer.version:
+                    logger.info(f"Community summaries changed ({self.summarizer.version} -> {stored_version}), reloading")
+                    # Load into a fresh summarizer and swap it in with one assignment, so
+                    # concurrent requests never see a half-reloaded summarizer
+                    self.summarizer = CommunitySummarizer().load(self.summarizer.file_name)
+                summary_version = self.summarizer.version
+            except Exception as e:
+                logger.warning(f"Could not check the community summaries version: {e}")
+
+            try:
+                stored_graph_version = self.indexer.graph_version()
+                if stored_graph_version != graph_version:
+                    self.indexer.refresh_local_indexes(stored_graph_version)
+                graph_version = stored_graph_version
+            except Exception as e:
+                logger.warning(f"Could not check the graph version: {e}")
+
+            self._versions = (summary_version, graph_version)
+            return self._versions
+
+    def _answer_cache(self, mode):
+        """
+        Answer cache for a retrieval mode, cleared whenever the community summaries
+        or the graph were rebuilt.
+        """
+        answer_cache = self.answer_caches[mode]
+        version = self.refresh_versions()
+        if answer_cache.version != version:
+            answer_cache.invalidate(version)
+        return answer_cache
+
+    def get_cached_answer(self, query, mode="local"):
+        """
+        Look up a stored answer for a semantically near-identical earlier query.
+        
+        Args:
+            query (str): The user's query
+            mode (str): Retrieval mode the answer must have been produced with
+            
+        Returns:
+            GenerationResult or None: The cached result, if any
+        """
+        answer_cache = self._answer_cache(mode)
+        embedding = self.indexer.get_embeddings([query])[0]
+        result = answer_cache.lookup(embedding)
+        return replace(result, cached=True) if result is not None else None
+
+    def cache_answer(self, query, result, mode="local"):
+        """
+        Store a generated result for reuse by near-identical queries.
+        """
+        embedding = self.indexer.get_embeddings([query])[0]
+        self._answer_cache(mode).add(embedding, result)
+
+    def answer(self, query, mode="local"):
+        """
+        Answer the query with a single retrieval, returning everything the UI needs.
+        
+        Args:
+            query (str): The user's query
+            mode (str): "local" (entity retrieval) or "global" (summary similarity)
+            
+        Process:
+        0. Return a cached answer for a near-identical earlier query, if any
+        1. Retrieve entities once for the query
+        2. Pack the ranked community summaries for those entities as context
+        3. Use GPT-4 to generate a response based on the context
+        
+        Returns:
+            GenerationResult: The answer together with the entities and summaries used
+        """
+        cached = self.get_cached_answer(query, mode)
+        if cached is not None:
+            return cached
+
+        entities, context = self.retrieve_context(query, mode)
 
         # Generate response using GPT-4
         response = client.chat.completions.create(
             model="gpt-4o-mini",  # Using GPT-4 mini model
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"CONTEXT: {context}\n\nQUERY: {query}"},
-            ],
+            messages=self.build_messages(query, context.summaries),
+        )
+
+        result = GenerationResult(
+            answer=response.choices[0].message.content,
+            entities=entities,
+            summaries=context.summaries,
+            context_tokens=context.used_tokens,
+            dropped_tokens=context.dropped_tokens,
+        )
+        self.cache_answer(query, result, mode)
+        return result
+
+    def stream_answer(self, query, summaries):
+        """
+        Stream the response to the query token by token as it is generated.
+        
+        Args:
+            query (str): The user's query
+            summaries (list): Context summaries, e.g. from retrieve_context
+            
+        Yields:
+            str: Response text fragments in order
+        """
+        stream = client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self.build_messages(query, summaries),
+            stream=True,
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    async def aretrieve_context(self, query, mode="local"):
+        """
+        Async counterpart of retrieve_context.
+        """
+        if mode == "global":
+            embedding = (await self.indexer.aget_embeddings([query]))[0]
+            ranked = self.summarizer.search_summaries(embedding, self.global_top_k)
+            return [], self.context_builder.pack([summary for summary, _ in ranked])
+
+        scored_entities = await self.indexer.aretrieve_scored(query)
+        entities = [entity for entity, _ in scored_entities]
+        context = self.context_builder.build(scored_entities, self.summarizer)
+        return entities, context
+
+    async def aget_cached_answer(self, query, mode="local"):
+        """
+        Async counterpart of get_cached_answer.
+        """
+        # Version checks do blocking I/O, so run them off the event loop
+        await asyncio.to_thread(self.refresh_versions)
+        answer_cache = self._answer_cache(mode)
+        embedding = (await self.indexer.aget_embeddings([query]))[0]
+        result = answer_cache.lookup(embedding)
+        return replace(result, cached=True) if result is not None else None
+
+    async def acache_answer(self, query, result, mode="local"):
+        embedding = (await self.indexer.aget_embeddings([query]))[0]
+        await asyncio.to_thread(self.refresh_versions)
+        self._answer_cache(mode).add(embedding, result)
+
+    async def aanswer(self, query, mode="local"):
+        """
+        Async counterpart of answer, built on AsyncOpenAI and the async Neo4j driver.
+        """
+        cached = await self.aget_cached_answer(query, mode)
+        if cached is not None:
+            return cached
+
+        entities, context = await self.aretrieve_context(query, mode)
+
+        response = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self.build_messages(query, context.summaries),
+        )
+
+        result = GenerationResult(
+            answer=response.choices[0].message.content,
+            entities=entities,
+            summaries=context.summaries,
+            context_tokens=context.used_tokens,
+            dropped_tokens=context.dropped_tokens,
         )
+        await self.acache_answer(query, result, mode)
+        return result
 
-        return response.choices[0].message.content
+    async def agenerate(self, query, mode="local"):
+        """
+        Async counterpart of generate.
+        """
+        return (await self.aanswer(query, mode)).answer
+
+    async def astream_answer(self, query, summaries):
+        """
+        Async counterpart of stream_answer.
+        """
+        stream = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self.build_messages(query, summaries),
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
 
 
 if __name__ == '__main__':
     
-    from graph_communities import CommunitySummarizer
     from data_index import DataIndexer
 
     # Initialize components
@@ -1,14 +1,26 @@
 import networkx as nx
 from graspologic.partition import hierarchical_leiden
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from collections import defaultdict
+from concurrency import RateLimiter, run_bounded, estimate_tokens
+from community_store import CommunityStore
+from batch_embedder import BatchEmbedder, is_retryable
+from cache import EmbeddingCache
+import numpy as np
+import asyncio
+import hashlib
+import logging
 import pickle
+import uuid
 import os
 from dotenv import load_dotenv
 load_dotenv()  
 # openai_api_key = os.environ['OPENAI_API_KEY'] 
 openai_api_key= os.getenv('OPENAI_API_KEY')
 client = OpenAI(api_key=openai_api_key)
+async_client = AsyncOpenAI(api_key=openai_api_key)
+
+logger = logging.getLogger(__name__)
 
 
 system_prompt = """
@@ -20,11 +32,30 @@ The goal is to capture the most critical and relevant details that highlight the
 Ensure that the summary is coherent and integrates the information in a way that emphasizes the key aspects of the relationships."
 """
 
+parent_system_prompt = """
+You are provided with summaries of several sub-communities that together form a larger community of a knowledge graph.
+Your task is to create a single higher-level summary of the larger community.
+The summary should name the most important entities, capture the themes shared across the sub-communities and how they relate,
+and leave out details that only matter within a single sub-community. Keep it concise and coherent.
+"""
+
 class CommunitySummarizer:
 
     def __init__(self):
         self.summaries_dict = None
         self.community_dict = None
+        # Changes whenever communities are rebuilt, so caches can detect stale answers
+        self.version = None
+        # Store the summarizer was last loaded from or saved to
+        self.file_name = None
+        # Content hash of each community's members, used to reuse unchanged summaries
+        self.summary_hashes = {}
+        # Community hierarchy: level of each community and its parent (None at the top level)
+        self.community_levels = {}
+        self.community_parents = {}
+        # Row-normalized summary embeddings and the community id of each row
+        self.summary_matrix = None
+        self.summary_clusters = None
 
     def create_nx_graph(self, relationships):
         """
@@ -42,36 +73,210 @@ class CommunitySummarizer:
             )
         return nx_graph
     
-    def create_communities(self, nx_graph):
-        return hierarchical_leiden(nx_graph, max_cluster_size=5)
+    def create_edge_list(self, relationships):
+        """
+           Build an integer-indexed, deduplicated undirected edge list for clustering.
+           Only topology is kept; descriptions stay out of the clustering graph.
+
+           Returns:
+               tuple: (node names indexed by id, list of (source_id, target_id, weight))
+        """
+        ids = {}
+        sources = np.fromiter(
+            (ids.setdefault(r.source_id, len(ids)) for r in relationships), dtype=np.int64, count=len(relationships)
+        )
+        targets = np.fromiter(
+            (ids.setdefault(r.target_id, len(ids)) for r in relationships), dtype=np.int64, count=len(relationships)
+        )
+        # Same undirected edge in either direction collapses to one (low, high) pair
+        low, high = np.minimum(sources, targets), np.maximum(sources, targets)
+        keys = np.unique(low * max(len(ids), 1) + high)
+        low, high = np.divmod(keys, max(len(ids), 1))
+        edges = list(zip(low.tolist(), high.tolist(), [1.0] * len(keys)))
+        return list(ids), edges
+
+    def create_communities(self, graph, names=None):
+        """
+           Run hierarchical Leiden on a NetworkX graph or an integer edge list.
+           For an edge list, pass the node names so clusters refer to entity names.
+        """
+        clusters = hierarchical_leiden(graph, max_cluster_size=5)
+        if names is not None:
+            clusters = [cluster._replace(node=names[cluster.node]) for cluster in clusters]
+        return clusters
     
     def get_communities(self, clusters, entities, relationships):
+        """
+           Group entities and relationships by cluster.
+           Name->entity and node->incident-relationship indexes are built once,
+           so grouping is linear in clusters + entities + relationships.
+        """
+        entities_by_name = defaultdict(list)
+        for entity in entities:
+            entities_by_name[entity.name].append(entity)
+
+        incident = defaultdict(list)
+        for relationship in relationships:
+            incident[relationship.source_id].append(relationship)
+            if relationship.target_id != relationship.source_id:
+                incident[relationship.target_id].append(relationship)
+
         entity_dict = defaultdict(list)
         relationship_dict = defaultdict(list)
         self.community_dict = defaultdict(list)
+        self.community_levels = {}
+        self.community_parents = {}
         for cluster in clusters:
-            for entity in entities:
-                if cluster.node == entity.name:
-                    entity_dict[cluster.cluster].append(entity)
-
-            for relationship in relationships:
-                if cluster.node == relationship.source_id or cluster.node == relationship.target_id:
-                    relationship_dict[cluster.cluster].append(relationship)
-
+            self.community_levels[cluster.cluster] = cluster.level
+            self.community_parents[cluster.cluster] = cluster.parent_cluster
+            if cluster.node in entities_by_name:
+                entity_dict[cluster.cluster].extend(entities_by_name[cluster.node])
+            if cluster.node in incident:
+                relationship_dict[cluster.cluster].extend(incident[cluster.node])
             self.community_dict[cluster.node].append(cluster.cluster)
         
         return entity_dict, relationship_dict
     
-    def summarize_communities(self, entity_dict, relationship_dict):
-        summaries_dict = {}
-        for cluster, entities in entity_dict.items():
-            relationships = relationship_dict[cluster]
-            summary = self.summarize_community(entities, relationships)
-            summaries_dict[cluster] = summary
-
-        return summaries_dict
-    
-    def get_summaries_for_entity(self, entity_name):
+    def summarize_communities(self, entity_dict, relationship_dict, max_concurrency=8,
+                              requests_per_minute=500, tokens_per_minute=200_000, progress=None):
+        """
+           Summarize every community concurrently.
+           Requests are bounded by max_concurrency and the request/token-per-minute
+           limits, and each summary failing transiently is retried with backoff. Communities
+           whose content hash matches the previous build reuse the stored summary.
+           A community that still fails is left out (and retried on the next run)
+           instead of discarding every summary already generated.
+        """
+        return asyncio.run(self.asummarize_communities(
+            entity_dict, relationship_dict, max_concurrency,
+            requests_per_minute, tokens_per_minute, progress,
+        ))
+
+    async def asummarize_communities(self, entity_dict, relationship_dict, max_concurrency=8,
+                                     requests_per_minute=500, tokens_per_minute=200_000, progress=None):
+        """
+           Async counterpart of summarize_communities.
+           Leaf communities are summarized from their members' descriptions; parent
+           communities are then summarized level by level from their children's summaries.
+        """
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        children = self.community_children()
+        summaries, hashes = {}, {}
+
+        def summarize_level(clusters, hash_fn, summarize_fn, token_cost, description):
+            return self._summarize_level(
+                clusters, summaries, hashes, hash_fn, summarize_fn, token_cost,
+                limiter, max_concurrency, progress, description,
+            )
+
+        def leaf_token_cost(cluster):
+            # Prompt estimate plus a typical summary length
+            texts = [e.properties['entity_description'] for e in entity_dict[cluster]]
+            texts += [r.properties['relationship_description'] for r in relationship_dict[cluster]]
+            return sum(estimate_tokens(t) for t in texts) + 500
+
+        def child_summaries(cluster):
+            # Children whose summary failed are left out; the parent hash changes with them
+            return [summaries[child] for child in children[cluster] if child in summaries]
+
+        leaves = [c for c in entity_dict if not children.get(c)]
+        await summarize_level(
+            leaves,
+            lambda c: self.community_hash(entity_dict[c], relationship_dict[c]),
+            lambda c: self.asummarize_community(entity_dict[c], relationship_dict[c]),
+            leaf_token_cost,
+            "leaf community summaries",
+        )
+
+        parents = [c for c in entity_dict if children.get(c)]
+        for level in sorted({self.community_levels[c] for c in parents}, reverse=True):
+            await summarize_level(
+                [c for c in parents if self.community_levels[c] == level and child_summaries(c)],
+                lambda c: self.parent_hash(child_summaries(c)),
+                lambda c: self.asummarize_parent(child_summaries(c)),
+                lambda c: sum(estimate_tokens(t) for t in child_summaries(c)) + 500,
+                f"level {level} community summaries",
+            )
+
+        self.summary_hashes = hashes
+        missing = [c for c in entity_dict if c not in summaries]
+        if missing:
+            logger.error(f"{len(missing)} communities could not be summarized and were left out")
+        return {c: summaries[c] for c in entity_dict if c in summaries}
+
+    async def _summarize_level(self, clusters, summaries, hashes, hash_fn, summarize_fn, token_cost,
+                               limiter, max_concurrency, progress, description):
+        """
+           Summarize one batch of communities, reusing summaries of communities
+           whose content hash is unchanged since the last run.
+        """
+        level_hashes = {c: hash_fn(c) for c in clusters}
+        previous = self.reusable_summaries(level_hashes.values())
+        todo = []
+        for c in clusters:
+            if level_hashes[c] in previous:
+                summaries[c] = previous[level_hashes[c]]
+            else:
+                todo.append(c)
+        logger.info(f"Reusing {len(clusters) - len(todo)} unchanged {description}, summarizing {len(todo)}")
+
+        results = await run_bounded(
+            todo,
+            summarize_fn,
+            max_concurrency=max_concurrency,
+            limiter=limiter,
+            token_cost=token_cost,
+            retryable=is_retryable,
+            progress=progress,
+            description=description,
+            return_exceptions=True,
+        )
+        for c, result in zip(todo, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Failed to summarize community {c}: {result}")
+                continue
+            summaries[c] = result
+        # Only successful summaries are recorded, so failed ones are retried next run
+        hashes.update((c, h) for c, h in level_hashes.items() if c in summaries)
+
+    def community_children(self):
+        """
+           Community id -> ids of its child communities
+        """
+        children = defaultdict(list)
+        for cluster, parent in self.community_parents.items():
+            if parent is not None and parent != -1:
+                children[parent].append(cluster)
+        return children
+
+    def parent_hash(self, child_summaries):
+        """
+           Hash of a parent community's child summaries and the parent prompt.
+        """
+        content = "\n".join([parent_system_prompt, *sorted(child_summaries)])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def reusable_summaries(self, hashes):
+        """
+           Content hash -> summary from the previous build, for the given hashes
+        """
+        if isinstance(self.summaries_dict, CommunityStore):
+            return self.summaries_dict.summaries_for_hashes(hashes)
+        if not self.summaries_dict:
+            return {}
+        wanted = set(hashes)
+        return {h: self.summaries_dict[c] for c, h in self.summary_hashes.items()
+                if h in wanted and c in self.summaries_dict}
+
+    def num_levels(self):
+        return max(self.community_levels.values()) + 1 if self.community_levels else 0
+
+    def get_summaries_for_entity(self, entity_name, level=None):
+        """
+           Summaries of the entity's communities. With a level, only the entity's
+           community at that level (or its deepest one above it) is returned;
+           otherwise communities from every level are returned.
+        """
         if not (self.summaries_dict and self.community_dict):
             raise Exception('Missing summaries')
         
@@ -79,13 +284,39 @@ class CommunitySummarizer:
             return []
         
         communities = self.community_dict[entity_name]
-        summaries = [self.summaries_dict[c] for c in communities]
+        if level is not None and self.community_levels:
+            candidates = [c for c in communities if self.community_levels.get(c, 0) <= level]
+            if not candidates:
+                return []
+            communities = [max(candidates, key=lambda c: self.community_levels.get(c, 0))]
+        # Communities whose summary failed in the last build have none
+        summaries = [self.summaries_dict[c] for c in communities if c in self.summaries_dict]
         return summaries
 
-    def summarize_community(self, entities, relationships):
-
+    def community_text(self, entities, relationships):
+        """
+           Format community members as the prompt text sent for summarization.
+        """
         entities_text = "\n".join([f"{e.name}->{e.label}->{e.properties['entity_description']}" for e in entities])
         relationships_text = "\n".join([f"{r.source_id}->{r.target_id}->{r.label}->{r.properties['relationship_description']}" for r in relationships])
+        return entities_text, relationships_text
+
+    def community_hash(self, entities, relationships):
+        """
+           Hash of a community's member descriptions and the summarization prompt.
+           Member order does not affect the hash.
+        """
+        entities_text, relationships_text = self.community_text(entities, relationships)
+        content = "\n".join([
+            system_prompt,
+            "\n".join(sorted(entities_text.split("\n"))),
+            "\n".join(sorted(relationships_text.split("\n"))),
+        ])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def summarize_community(self, entities, relationships):
+
+        entities_text, relationships_text = self.community_text(entities, relationships)
 
         completion = client.chat.completions.create(
             model="gpt-4o-mini",
@@ -97,19 +328,184 @@ class CommunitySummarizer:
 
         return completion.choices[0].message.content
     
-    def save(self, file_name='communities.pkl'):
-        with open(file_name, 'wb') as outp:
-            pickle.dump(self, outp, pickle.HIGHEST_PROTOCOL)
+    async def asummarize_community(self, entities, relationships):
+        """
+           Async counterpart of summarize_community.
+        """
+        entities_text, relationships_text = self.community_text(entities, relationships)
+
+        completion = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"entities: {entities_text}\n\nrelationships: {relationships_text}"},
+            ],
+        )
+
+        return completion.choices[0].message.content
+    
+    async def asummarize_parent(self, child_summaries):
+        """
+           Summarize a parent community from its child communities' summaries.
+        """
+        completion = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=[
+                {"role": "system", "content": parent_system_prompt},
+                {"role": "user", "content": "sub-community summaries:\n\n" + "\n\n".join(child_summaries)},
+            ],
+        )
+
+        return completion.choices[0].message.content
+    
+    def embedding_lookup(self):
+        """
+           Function mapping content hashes to summary embeddings of the current build.
+           Captured before a rebuild replaces the summaries, so unchanged ones keep their vectors.
+        """
+        if isinstance(self.summaries_dict, CommunityStore):
+            return self.summaries_dict.embeddings_for_hashes
+        by_hash = {}
+        if self.summary_matrix is not None:
+            rows = {int(c): i for i, c in enumerate(self.summary_clusters)}
+            by_hash = {h: self.summary_matrix[rows[c]] for c, h in self.summary_hashes.items() if c in rows}
+        return lambda hashes: {h: by_hash[h] for h in hashes if h in by_hash}
+
+    def embed_summaries(self, model="text-embedding-3-small", previous=None, embedding_cache=None):
+        """
+           Embed every community summary into a row-normalized matrix.
+
+           Args:
+               previous: Optional embedding_lookup() of the previous build; summaries
+                   with an unchanged content hash reuse its vectors
+               embedding_cache: EmbeddingCache consulted before calling the API
+                   (defaults to one on EMBEDDING_CACHE_PATH)
+        """
+        clusters = list(self.summaries_dict)
+        hashes = [self.summary_hashes.get(c) for c in clusters]
+        reused = previous([h for h in hashes if h]) if previous is not None else {}
+        todo = [i for i, h in enumerate(hashes) if h not in reused]
+
+        if embedding_cache is None:
+            embedding_cache = EmbeddingCache(path=os.getenv('EMBEDDING_CACHE_PATH'))
+        texts = [self.summaries_dict[clusters[i]] for i in todo]
+        cached = embedding_cache.get_many(model, texts)
+        missing = [j for j in range(len(texts)) if j not in cached]
+        if missing:
+            new_embeddings = BatchEmbedder(client, model=model).embed([texts[j] for j in missing])
+            embedding_cache.set_many(model, [texts[j] for j in missing], new_embeddings)
+            cached.update(zip(missing, new_embeddings))
+        logger.info(f"Reusing {len(clusters) - len(missing)} summary embeddings, embedded {len(missing)}")
+
+        embeddings = [None] * len(clusters)
+        for i, h in enumerate(hashes):
+            if h in reused:
+                embeddings[i] = reused[h]
+        for j, i in enumerate(todo):
+            embeddings[i] = cached[j]
+        matrix = np.asarray(embeddings, dtype=np.float32).reshape(len(clusters), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        self.summary_matrix = matrix / np.where(norms == 0, 1, norms)
+        self.summary_clusters = np.asarray(clusters, dtype=np.int64)
+
+    def search_summaries(self, embedding, top_k=5):
+        """
+           Find the community summaries most similar to a query embedding.
+
+           Returns:
+               list: (summary, score) pairs, best first
+        """
+        if self.summary_matrix is None and isinstance(self.summaries_dict, CommunityStore):
+            clusters, matrix = self.summaries_dict.load_embeddings()
+            # Clusters first: a concurrent search seeing no matrix yet just loads it again
+            self.summary_clusters = clusters
+            self.summary_matrix = matrix
+        if self.summary_matrix is None:
+            raise Exception('Missing summary embeddings')
+        if not len(self.summary_clusters):
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        scores = self.summary_matrix @ (query / np.linalg.norm(query))
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.summaries_dict[int(self.summary_clusters[i])], float(scores[i])) for i in top]
+
+    def save(self, file_name='communities.db'):
+        """
+           Write summaries, hierarchy, entity memberships, hashes and summary embeddings
+           to a versioned SQLite store.
+        """
+        embeddings = None
+        if self.summary_matrix is not None:
+            embeddings = {int(c): row for c, row in zip(self.summary_clusters, self.summary_matrix)}
+        CommunityStore.write(
+            file_name, self.summaries_dict, self.community_dict,
+            summary_hashes=self.summary_hashes, version=self.version,
+            community_levels=self.community_levels, community_parents=self.community_parents,
+            embeddings=embeddings,
+        )
+        self.file_name = file_name
+
+    def stored_version(self):
+        """
+           Version of the saved store this summarizer was loaded from, which differs
+           from self.version once another process has rebuilt the communities.
+        """
+        if self.file_name is None or self.file_name.endswith('.pkl') or not os.path.exists(self.file_name):
+            return self.version
+        return CommunityStore.read_version(self.file_name)
         
-    def load(self, file_name='communities.pkl'):
-        with open(file_name, 'rb') as inp:
-            obj = pickle.load(inp)
-            self.__dict__.update(obj.__dict__)
+    def load(self, file_name='communities.db'):
+        """
+           Open a saved store. Only the entity -> community index is loaded into
+           memory; summary text is read lazily. Legacy .pkl files are still accepted,
+           and a legacy communities.pkl next to a missing communities.db is converted.
+        """
+        if file_name.endswith('.pkl'):
+            with open(file_name, 'rb') as inp:
+                obj = pickle.load(inp)
+                self.__dict__.update(obj.__dict__)
+            self.file_name = file_name
+            return self
+
+        legacy_file = f"{os.path.splitext(file_name)[0]}.pkl"
+        if not os.path.exists(file_name) and os.path.exists(legacy_file):
+            # Deployments built before the SQLite store only have the pickle: load it
+            # and convert it once, keeping the pickle in use if the store cannot be written
+            logger.warning(f"{file_name} not found, converting legacy {legacy_file}")
+            self.load(legacy_file)
+            try:
+                self.version = self.version or uuid.uuid4().hex
+                self.save(file_name)
+            except Exception as e:
+                logger.error(f"Could not convert {legacy_file} to {file_name}: {e}")
+                return self
+
+        store = CommunityStore(file_name)
+        self.summaries_dict = store
+        self.community_dict = store.load_community_dict()
+        self.community_levels, self.community_parents = store.load_hierarchy()
+        self.summary_hashes = {}
+        self.version = store.version
+        self.file_name = file_name
+
+        # Summary embeddings are read on the first global search, not at startup
+        self.summary_clusters, self.summary_matrix = None, None
         return self
        
-    def run(self, entities, relationships):
-        nx_graph = self.create_nx_graph(relationships)
-        clusters = self.create_communities(nx_graph)
+    def run(self, entities, relationships, file_name='communities.db'):
+        # Start from the previous build, if any, so unchanged communities are not re-summarized
+        if self.summaries_dict is None and os.path.exists(file_name):
+            self.load(file_name)
+
+        previous_embeddings = self.embedding_lookup()
+
+        names, edges = self.create_edge_list(relationships)
+        clusters = self.create_communities(edges, names)
         entity_dict, relationship_dict = self.get_communities(clusters, entities, relationships)
         self.summaries_dict = self.summarize_communities(entity_dict, relationship_dict)
-        self.save()
\ No newline at end of file
+        self.embed_summaries(previous=previous_embeddings)
+        self.version = uuid.uuid4().hex
+        self.save(file_name)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from llama_index.core.schema import TextNode
 from data_models import KnowledgeModel
 from llama_index.core.graph_stores.types import (
@@ -7,13 +7,28 @@ from llama_index.core.graph_stores.types import (
     KG_RELATIONS_KEY,
     Relation,
 )
-from multiprocessing import Pool, cpu_count
+from concurrency import RateLimiter, run_bounded, estimate_tokens
+from batch_embedder import is_retryable
+from cache import DiskStore
+import asyncio
+import hashlib
+import json
+import logging
 import os
 from dotenv import load_dotenv
 load_dotenv()  
 
 openai_api_key= os.getenv('OPENAI_API_KEY')
 client = OpenAI(api_key=openai_api_key)
+async_client = AsyncOpenAI(api_key=openai_api_key)
+
+logger = logging.getLogger(__name__)
+
+extraction_model = "gpt-4o-mini"
+# Any change to the response schema invalidates previously cached extractions
+schema_version = hashlib.sha256(
+    json.dumps(KnowledgeModel.model_json_schema(), sort_keys=True).encode("utf-8")
+).hexdigest()
 
 system_prompt = """
     -Goal-
@@ -34,6 +49,49 @@ system_prompt = """
 """
 
 class GraphExtractor:
+    def __init__(self, cache_path=None):
+        """
+        Args:
+            cache_path (str): SQLite file of cached extractions
+                (defaults to EXTRACTION_CACHE_PATH, then 'extraction_cache.db')
+        """
+        cache_path = cache_path or os.getenv('EXTRACTION_CACHE_PATH', 'extraction_cache.db')
+        self.cache = DiskStore(cache_path, table="extractions")
+
+    def cache_key(self, node: TextNode):
+        """
+        Content address of an extraction: chunk text, system prompt, model and response schema
+        """
+        content = json.dumps([node.get_content(), system_prompt, extraction_model, schema_version])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def apply_knowledge_model(self, node: TextNode, knowledge_model: KnowledgeModel):
+        """
+        Store the converted entities and relationships in the node metadata
+        """
+        entities, relationships = self.convert_to_llamaindex(knowledge_model)
+        
+        node.metadata[KG_NODES_KEY] = entities          # Store entities
+        node.metadata[KG_RELATIONS_KEY] = relationships # Store relationships
+        
+        return node
+
+    def apply_completion(self, node: TextNode, completion):
+        """
+        Cache and apply a structured extraction response. A refusal has no parsed
+        model: the chunk gets no graph elements, and is not cached so it is tried again.
+        """
+        #Get the parsed knowledge model from response
+        message = completion.choices[0].message
+        if message.parsed is None:
+            logger.warning(f"Extraction refused for node {node.node_id}: {message.refusal}")
+            node.metadata[KG_NODES_KEY] = []
+            node.metadata[KG_RELATIONS_KEY] = []
+            return node
+
+        self.cache.set(self.cache_key(node), message.parsed.model_dump(mode="json"))
+        return self.apply_knowledge_model(node, message.parsed)
+
     def extract_from_node(self, node: TextNode):
         """
         Extract knowledge graph elements from a text node using GPT-4.
@@ -42,16 +100,22 @@ class GraphExtractor:
             node (TextNode): A text node containing content to analyze
             
         Process:
-        1. Send text to GPT-4 for entity and relationship extraction.
-        2. Convert the response into LlamaIndex format.
-        3. Add extracted information to node metadata
+        1. Reuse a cached extraction of the same content if one exists.
+        2. Otherwise send text to GPT-4 for entity and relationship extraction.
+        3. Convert the response into LlamaIndex format.
+        4. Add extracted information to node metadata
         
         Returns:
             TextNode: The input node with updated metadata containing graph elements
         """
+        key = self.cache_key(node)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self.apply_knowledge_model(node, KnowledgeModel.model_validate(cached))
+
         # Use GPT-4 to extract knowledge graph elements
         completion = client.beta.chat.completions.parse(
-            model="gpt-4o-mini",
+            model=extraction_model,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"text: {node}"}
@@ -60,15 +124,22 @@ class GraphExtractor:
             response_format=KnowledgeModel,
         )
 
-        #Get the parsed knowledge model from response
-        knowledge_model = completion.choices[0].message.parsed
-        
-        entities, relationships = self.convert_to_llamaindex(knowledge_model)
-        
-        node.metadata[KG_NODES_KEY] = entities          # Store entities
-        node.metadata[KG_RELATIONS_KEY] = relationships # Store relationships
-        
-        return node
+        return self.apply_completion(node, completion)
+
+    async def aextract_from_node(self, node: TextNode):
+        """
+        Async counterpart of extract_from_node (cache lookups are batched by aextract).
+        """
+        completion = await async_client.beta.chat.completions.parse(
+            model=extraction_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": f"text: {node}"}
+            ],
+            response_format=KnowledgeModel,
+        )
+
+        return self.apply_completion(node, completion)
 
     def convert_to_llamaindex(self, knowledge_model: KnowledgeModel):
         """
@@ -116,21 +187,52 @@ class GraphExtractor:
         
         return entities, relationships
 
-    def extract(self, nodes):
+    def extract(self, nodes, max_concurrency=16, requests_per_minute=500, tokens_per_minute=200_000):
         """
-        Process multiple nodes in parallel using multiprocessing.
+        Process multiple nodes concurrently with an async I/O engine.
         
         Args:
             nodes (list): List of TextNodes to process
+            max_concurrency (int): Maximum extraction requests in flight (independent of CPU count)
+            requests_per_minute (int): Request rate limit
+            tokens_per_minute (int): Token rate limit (prompt estimate plus expected output)
             
         Process:
-        1. Create a process pool using available CPU cores
-        2. Process nodes in parallel using extract_from_node
+        1. Reuse cached extractions for chunks whose content has not changed
+        2. Rate-limit and bound the number of in-flight extraction requests
+        3. Retry each chunk failing transiently with exponential backoff
         
         Returns:
-            list: Processed nodes with extracted graph information
+            list: Processed nodes with extracted graph information, in input order
+        """
+        return asyncio.run(self.aextract(nodes, max_concurrency, requests_per_minute, tokens_per_minute))
+
+    async def aextract(self, nodes, max_concurrency=16, requests_per_minute=500, tokens_per_minute=200_000):
+        """
+        Async counterpart of extract.
         """
-        #Use multiprocessing to process nodes in parallel
-        with Pool(cpu_count()) as pool:
-            nodes = pool.map(self.extract_from_node, nodes)
-        return nodes
\ No newline at end of file
+        nodes = list(nodes)
+        keys = [self.cache_key(node) for node in nodes]
+        cached = self.cache.get_many(keys)
+        for node, key in zip(nodes, keys):
+            if key in cached:
+                self.apply_knowledge_model(node, KnowledgeModel.model_validate(cached[key]))
+        missing = [node for node, key in zip(nodes, keys) if key not in cached]
+        logger.info(f"Extraction cache: {len(nodes) - len(missing)} hits, {len(missing)} chunks to extract")
+
+        limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+
+        def token_cost(node):
+            # Prompt plus a typical structured extraction response
+            return estimate_tokens(system_prompt) + estimate_tokens(str(node)) + 1000
+
+        await run_bounded(
+            missing,
+            self.aextract_from_node,
+            max_concurrency=max_concurrency,
+            limiter=limiter,
+            token_cost=token_cost,
+            retryable=is_retryable,
+            description="chunks extracted",
+        )
+        return nodes
@@ -5,14 +5,16 @@ from llama_index.core.graph_stores.types import (
     KG_RELATIONS_KEY,
     Relation
 )
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from collections import defaultdict
+import asyncio
 import os
 from dotenv import load_dotenv
 load_dotenv()  
 
 openai_api_key= os.getenv('OPENAI_API_KEY')
 client = OpenAI(api_key=openai_api_key)
+async_client = AsyncOpenAI(api_key=openai_api_key)
 
 
 system_prompt = """
@@ -30,6 +32,29 @@ class GraphResolver:
     Handles merging of descriptions and resolving conflicts.
     """
 
+    def entity_messages(self, descriptions, entity_name):
+        """
+        Chat messages asking for a consolidated entity description.
+        """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"entity: {entity_name}\n\ndescriptions: {descriptions}"},
+        ]
+
+    def relation_messages(self, descriptions, source_entity, target_entity, relation):
+        """
+        Chat messages asking for a consolidated relationship description.
+        """
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": 
+                f"Source_entity: {source_entity}\n"
+                f"Target_entity: {target_entity}\n"
+                f"Relation: {relation}\n\n"
+                f"descriptions: {descriptions}"
+            },
+        ]
+
     def summarize_entity(self, descriptions, entity_name):
         """
         Generate a consolidated summary for an entity with multiple descriptions.
@@ -46,9 +71,7 @@ class GraphResolver:
 
         completion = client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"entity: {entity_name}\n\ndescriptions: {descriptions}"},]
+            messages=self.entity_messages(descriptions, entity_name),
         )
         return completion.choices[0].message.content
     
@@ -67,18 +90,57 @@ class GraphResolver:
         """
         completion = client.chat.completions.create(
             model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": 
-                    f"Source_entity: {source_entity}\n"
-                    f"Target_entity: {target_entity}\n"
-                    f"Relation: {relation}\n\n"
-                    f"descriptions: {descriptions}"
-                },
-            ]
+            messages=self.relation_messages(descriptions, source_entity, target_entity, relation),
         )
         return completion.choices[0].message.content
     
+    async def asummarize_entity(self, descriptions, entity_name):
+        """
+        Async counterpart of summarize_entity.
+        """
+        completion = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self.entity_messages(descriptions, entity_name),
+        )
+        return completion.choices[0].message.content
+
+    async def asummarize_relation(self, descriptions, source_entity, target_entity, relation):
+        """
+        Async counterpart of summarize_relation.
+        """
+        completion = await async_client.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=self.relation_messages(descriptions, source_entity, target_entity, relation),
+        )
+        return completion.choices[0].message.content
+
+    def group_entities(self, nodes):
+        """
+        Group the entities of all nodes by name.
+        """
+        entities_dict = defaultdict(list)
+        for node in nodes:
+            for entity in node.metadata[KG_NODES_KEY]:
+                entities_dict[entity.name].append(entity)
+        return entities_dict
+
+    def group_relationships(self, nodes):
+        """
+        Group the relationships of all nodes by source, target and type.
+        """
+        relationships_dict = defaultdict(list)
+        for node in nodes:
+            for relationship in node.metadata[KG_RELATIONS_KEY]:
+                key = (relationship.source_id, relationship.target_id, relationship.label)
+                relationships_dict[key].append(relationship)
+        return relationships_dict
+
+    def join_descriptions(self, items, key):
+        """
+        Combine the descriptions of duplicate entities or relationships for summarization.
+        """
+        return "\n\n".join([item.properties[key] for item in items])
+
     def resolve_entities(self, nodes):
         """
         Resolve and combine duplicate entities across nodes.
@@ -87,47 +149,36 @@ class GraphResolver:
             nodes(list): List of nodes containing entity information
             
         Process:
-        1. Collect all entities from nodes
-        2. Group entities by name
-        3. Merge descriptions for duplicates
-        4. Create final entity list
+        1. Group entities from all nodes by name
+        2. Merge descriptions for duplicates
+        3. Create final entity list
         
         Returns:
             list: List of unique EntityNode objects with merged descriptions
         """
-        #Collect all entities from nodes
-        entities = []
-        for node in nodes:
-            entities.extend(node.metadata[KG_NODES_KEY])
-
-        #Group entities by name
-        entities_dict = defaultdict(list)
-        for entity in entities:
-            entities_dict[entity.name].append(entity)
-
         final_entities = []
 
         #Process each group of entities
-        for name, entities in entities_dict.items():
+        for name, entities in self.group_entities(nodes).items():
             if len(entities) == 1:
                 #Single entity - use existing description
                 description = entities[0].properties["entity_description"]
             else:
                 #Multiple entities - combine and summarize descriptions
-                descriptions = "\n\n".join(
-                    [node.properties["entity_description"] for node in entities]
-                )
+                descriptions = self.join_descriptions(entities, "entity_description")
                 description = self.summarize_entity(descriptions, name)
             
             #Create final entity with merged description
-            final_entity = EntityNode(
-                name=name, 
-                label=entities[0].label, 
-                properties={"entity_description": description}
-            )
-            final_entities.append(final_entity)
+            final_entities.append(self.build_entity(name, entities, description))
 
         return final_entities
+
+    def build_entity(self, name, entities, description):
+        return EntityNode(
+            name=name, 
+            label=entities[0].label, 
+            properties={"entity_description": description}
+        )
     
     def resolve_relationships(self, nodes):
         """
@@ -137,51 +188,38 @@ class GraphResolver:
             nodes (list): List of nodes containing relationship information
             
         Process:
-        1. Collect all relationships from nodes
-        2. Group relationships by source, target, and type
-        3. Merge descriptions for duplicates
-        4. Create final relationship list
+        1. Group relationships from all nodes by source, target, and type
+        2. Merge descriptions for duplicates
+        3. Create final relationship list
         
         Returns:
             list: List of unique Relation objects with merged descriptions
         """
-        # Collect all relationships
-        relationships = []
-        for node in nodes:
-            relationships.extend(node.metadata[KG_RELATIONS_KEY])
-
-        # Group relationships by key components
-        relationships_dict = defaultdict(list)
-        for relationship in relationships:
-            key = (relationship.source_id, relationship.target_id, relationship.label)
-            relationships_dict[key].append(relationship)
-
         final_relationships = []
 
         # Process each group of relationships
-        for (source_entity, target_entity, relation), relationships in relationships_dict.items():
+        for key, relationships in self.group_relationships(nodes).items():
             if len(relationships) == 1:
                 # Single relationship - use existing description
                 description = relationships[0].properties["relationship_description"]
             else:
                 # Multiple relationships - combine and summarize descriptions
-                descriptions = "\n\n".join(
-                    [node.properties["relationship_description"] for node in relationships]
-                )
-                description = self.summarize_relation(
-                    descriptions, source_entity, target_entity, relation
-                )
+                descriptions = self.join_descriptions(relationships, "relationship_description")
+                description = self.summarize_relation(descriptions, *key)
             
             # Create final relationship with merged description
-            final_relationship = Relation(
-                label=relation,
-                source_id=source_entity,
-                target_id=target_entity,
-                properties={"relationship_description": description}
-            )
-            final_relationships.append(final_relationship)
+            final_relationships.append(self.build_relationship(key, description))
 
         return final_relationships
+
+    def build_relationship(self, key, description):
+        source_entity, target_entity, relation = key
+        return Relation(
+            label=relation,
+            source_id=source_entity,
+            target_id=target_entity,
+            properties={"relationship_description": description}
+        )
     
     def resolve(self, nodes):
         """
@@ -195,4 +233,52 @@ class GraphResolver:
         """
         entities = self.resolve_entities(nodes)
         relationships = self.resolve_relationships(nodes)
-        return entities, relationships
\ No newline at end of file
+        return entities, relationships
+
+    async def aresolve(self, nodes, max_concurrency=16):
+        """
+        Async counterpart of resolve: duplicate descriptions are summarized
+        concurrently, with at most max_concurrency requests in flight.
+        
+        Args:
+            nodes (list): List of nodes to process
+            max_concurrency (int): Maximum concurrent LLM requests
+            
+        Returns:
+            tuple: (resolved_entities, resolved_relationships)
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        entities_dict = self.group_entities(nodes)
+        relationships_dict = self.group_relationships(nodes)
+
+        async def entity_description(name, entities):
+            if len(entities) == 1:
+                return entities[0].properties["entity_description"]
+            descriptions = self.join_descriptions(entities, "entity_description")
+            return await bounded(self.asummarize_entity(descriptions, name))
+
+        async def relation_description(key, relationships):
+            if len(relationships) == 1:
+                return relationships[0].properties["relationship_description"]
+            descriptions = self.join_descriptions(relationships, "relationship_description")
+            return await bounded(self.asummarize_relation(descriptions, *key))
+
+        entity_descriptions, relation_descriptions = await asyncio.gather(
+            asyncio.gather(*[entity_description(n, e) for n, e in entities_dict.items()]),
+            asyncio.gather(*[relation_description(k, r) for k, r in relationships_dict.items()]),
+        )
+
+        final_entities = [
+            self.build_entity(name, entities, description)
+            for (name, entities), description in zip(entities_dict.items(), entity_descriptions)
+        ]
+        final_relationships = [
+            self.build_relationship(key, description)
+            for key, description in zip(relationships_dict, relation_descriptions)
+        ]
+        return final_entities, final_relationships
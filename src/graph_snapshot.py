@@ -0,0 +1,136 @@
+from collections import defaultdict
+import numpy as np
+import json
+import os
+
+
+class AdjacencySnapshot:
+    """
+    Compact, read-only adjacency snapshot of the knowledge graph in CSR form.
+
+    Nodes are integer ids into `names`; the neighbours of node i are
+    targets[offsets[i]:offsets[i + 1]] with interned relationship label ids in the
+    matching slice of `rel_ids`. Edges are stored in both directions, matching the
+    undirected expansion done in Neo4j. Arrays are saved as .npy files and
+    memory-mapped on load; `version` ties the snapshot to the graph it was built from.
+    """
+
+    def __init__(self, offsets, targets, rel_ids, names, labels, properties, rel_labels, version=None):
+        self.offsets = offsets
+        self.targets = targets
+        self.rel_ids = rel_ids
+        self.names = names
+        self.labels = labels
+        self.properties = properties
+        self.rel_labels = rel_labels
+        self.version = version
+        self.ids = {name: i for i, name in enumerate(names)}
+
+    @classmethod
+    def from_graph(cls, entities, relationships, version=None):
+        names = [e.name for e in entities]
+        ids = {name: i for i, name in enumerate(names)}
+        rel_labels = sorted({r.label for r in relationships})
+        rel_label_ids = {label: i for i, label in enumerate(rel_labels)}
+
+        adjacency = defaultdict(list)
+        for r in relationships:
+            if r.source_id not in ids or r.target_id not in ids:
+                continue
+            source, target, label = ids[r.source_id], ids[r.target_id], rel_label_ids[r.label]
+            adjacency[source].append((target, label))
+            adjacency[target].append((source, label))
+
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        for i in range(len(names)):
+            offsets[i + 1] = offsets[i] + len(adjacency[i])
+        edges = [edge for i in range(len(names)) for edge in adjacency[i]]
+        targets = np.fromiter((t for t, _ in edges), dtype=np.int32, count=len(edges))
+        rel_ids = np.fromiter((l for _, l in edges), dtype=np.int32, count=len(edges))
+
+        return cls(
+            offsets, targets, rel_ids, names,
+            labels=[e.label for e in entities],
+            properties=[dict(e.properties) for e in entities],
+            rel_labels=rel_labels,
+            version=version,
+        )
+
+    def save(self, path='graph_snapshot'):
+        np.save(f"{path}_offsets.npy", self.offsets)
+        np.save(f"{path}_targets.npy", self.targets)
+        np.save(f"{path}_rels.npy", self.rel_ids)
+        with open(f"{path}.json", 'w') as outp:
+            json.dump({
+                "version": self.version,
+                "names": self.names,
+                "labels": self.labels,
+                "properties": self.properties,
+                "rel_labels": self.rel_labels,
+            }, outp)
+
+    @classmethod
+    def load(cls, path='graph_snapshot'):
+        with open(f"{path}.json") as inp:
+            meta = json.load(inp)
+        return cls(
+            np.load(f"{path}_offsets.npy", mmap_mode='r'),
+            np.load(f"{path}_targets.npy", mmap_mode='r'),
+            np.load(f"{path}_rels.npy", mmap_mode='r'),
+            meta["names"], meta["labels"], meta["properties"], meta["rel_labels"],
+            version=meta["version"],
+        )
+
+    @staticmethod
+    def exists(path='graph_snapshot'):
+        return os.path.exists(f"{path}.json")
+
+    def __len__(self):
+        return len(self.names)
+
+    def neighbours(self, i, allowed_rels=None):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        targets = self.targets[start:end]
+        if allowed_rels is not None:
+            targets = targets[np.isin(self.rel_ids[start:end], allowed_rels)]
+        return targets
+
+    def expand(self, seeds, depth=2, max_per_node=10, rel_labels=None):
+        """
+           Breadth-first expansion from each seed, nearest neighbours first.
+           Like the Neo4j expansion query, every expanded node contributes at most
+           max_per_node distinct neighbours, so work per hop is bounded by the
+           frontier size rather than by node degree.
+
+           Yields records shaped like the Neo4j expansion query results:
+           dicts with seed_id, name, label, properties and hops.
+        """
+        allowed_rels = None
+        if rel_labels:
+            allowed_rels = np.array([i for i, l in enumerate(self.rel_labels) if l in set(rel_labels)], dtype=np.int32)
+
+        for seed in seeds:
+            seed_idx = self.ids.get(seed)
+            if seed_idx is None:
+                continue
+            seen = {seed_idx}
+            frontier = [seed_idx]
+            for hops in range(1, depth + 1):
+                next_frontier = []
+                for i in frontier:
+                    neighbours = list(dict.fromkeys(self.neighbours(i, allowed_rels).tolist()))
+                    for j in neighbours[:max_per_node]:
+                        if j in seen:
+                            continue
+                        seen.add(j)
+                        next_frontier.append(j)
+                        yield {
+                            "seed_id": seed,
+                            "name": self.names[j],
+                            "label": self.labels[j],
+                            "properties": self.properties[j],
+                            "hops": hops,
+                        }
+                if not next_frontier:
+                    break
+                frontier = next_frontier
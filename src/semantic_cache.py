@@ -0,0 +1,81 @@
+import numpy as np
+import threading
+
+
+class SemanticCache:
+    """
+    Bounded cache of answers keyed by query embedding.
+
+    A lookup returns the stored entry whose query embedding has the highest cosine
+    similarity with the new query, if it reaches `threshold`. Embeddings live in a
+    preallocated row-normalized matrix so a lookup is one matrix-vector product;
+    the least recently used row is overwritten when the cache is full.
+    """
+
+    def __init__(self, maxsize=1000, threshold=0.95):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self._matrix = None
+        self._entries = [None] * maxsize
+        self._last_used = np.zeros(maxsize, dtype=np.int64)
+        self._size = 0
+        self._clock = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding):
+        """
+           Return the cached entry most similar to the embedding, or None
+        """
+        with self._lock:
+            if not self._size:
+                self.misses += 1
+                return None
+            scores = self._matrix[:self._size] @ self._normalize(embedding)
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self._clock += 1
+            self._last_used[best] = self._clock
+            self.hits += 1
+            return self._entries[best]
+
+    def add(self, embedding, entry):
+        with self._lock:
+            vector = self._normalize(embedding)
+            if self._matrix is None:
+                self._matrix = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            if self._size < self.maxsize:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+            self._matrix[slot] = vector
+            self._entries[slot] = entry
+            self._clock += 1
+            self._last_used[slot] = self._clock
+
+    def invalidate(self, version=None):
+        """
+           Drop every entry, optionally recording the version the cache now tracks
+        """
+        with self._lock:
+            self._entries = [None] * self.maxsize
+            self._last_used[:] = 0
+            self._size = 0
+            self.version = version
+
+    def __len__(self):
+        return self._size
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": self._size}
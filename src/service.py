@@ -0,0 +1,110 @@
+from fastapi import FastAPI
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from typing import Literal
+from generation import Generator
+from graph_communities import CommunitySummarizer
+from data_index import DataIndexer
+from batch_embedder import AsyncMicroBatcher
+import asyncio
+import os
+import uvicorn
+from dotenv import load_dotenv
+load_dotenv()
+
+# Maximum number of questions processed at the same time by this worker
+max_concurrency = int(os.getenv('SERVICE_MAX_CONCURRENCY', 64))
+# Micro-batching window for embedding calls across in-flight requests (0 disables it)
+embedding_batch_window = float(os.getenv('SERVICE_EMBEDDING_BATCH_WINDOW', 0.005))
+
+# Process-wide components, created once at startup and shared by every request
+components = {}
+
+
+class QueryRequest(BaseModel):
+    query: str = Field(description="The user's insurance question")
+    mode: Literal["local", "global"] = Field(
+        default="local",
+        description="local: hybrid entity retrieval; global: community summary similarity",
+    )
+
+
+class EntityResponse(BaseModel):
+    name: str
+    label: str
+    score: float = 0.0
+
+
+class QueryResponse(BaseModel):
+    answer: str
+    entities: list[EntityResponse]
+    cached: bool
+    context_tokens: int
+
+
+class EntitiesResponse(BaseModel):
+    entities: list[EntityResponse]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """
+       Create warm RAG components once per process and release them on shutdown
+    """
+    summarizer = CommunitySummarizer()
+    indexer = DataIndexer()
+    summarizer.load()
+    if embedding_batch_window > 0:
+        indexer.embedding_batcher = AsyncMicroBatcher(indexer.embedder, window=embedding_batch_window)
+
+    components["indexer"] = indexer
+    components["generator"] = Generator(indexer, summarizer)
+    components["limit"] = asyncio.Semaphore(max_concurrency)
+    yield
+    await indexer.aclose()
+    components.clear()
+
+
+app = FastAPI(title="Insurance Knowledge Assistant", lifespan=lifespan)
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query(request: QueryRequest):
+    """
+       Answer a question with the hybrid Graph-RAG pipeline
+    """
+    async with components["limit"]:
+        result = await components["generator"].aanswer(request.query, request.mode)
+
+    return QueryResponse(
+        answer=result.answer,
+        entities=[EntityResponse(name=e.name, label=e.label) for e in result.entities],
+        cached=result.cached,
+        context_tokens=result.context_tokens,
+    )
+
+
+@app.post("/entities", response_model=EntitiesResponse)
+async def entities(request: QueryRequest):
+    """
+       Return the scored entities retrieved for a question, without generation
+    """
+    async with components["limit"]:
+        scored = await components["indexer"].aretrieve_scored(request.query)
+
+    return EntitiesResponse(
+        entities=[EntityResponse(name=e.name, label=e.label, score=score) for e, score in scored]
+    )
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+
+if __name__ == '__main__':
+    uvicorn.run(
+        app,
+        host=os.getenv('SERVICE_HOST', '0.0.0.0'),
+        port=int(os.getenv('SERVICE_PORT', 8000)),
+    )
@@ -0,0 +1,105 @@
+from llama_index.core.graph_stores.types import EntityNode
+import numpy as np
+import json
+import os
+
+
+class EntityVectorIndex:
+    """
+    In-process nearest-neighbour index over entity embeddings.
+
+    Embeddings are kept as a row-normalized float32 matrix so a query is a single
+    matrix-vector product followed by a partial sort. The matrix is saved as a .npy
+    file and memory-mapped on load, with entity metadata in a JSON sidecar;
+    `version` ties the index to the graph it was built from.
+    """
+
+    def __init__(self, matrix=None, names=None, labels=None, properties=None, version=None):
+        self.matrix = matrix
+        self.version = version
+        self.names = names or []
+        self.labels = labels or []
+        self.properties = properties or []
+
+    @classmethod
+    def from_entities(cls, entities, version=None):
+        """
+           Build the index from entities whose embedding has been set
+        """
+        entities = [e for e in entities if e.embedding is not None]
+        matrix = np.asarray([e.embedding for e in entities], dtype=np.float32)
+        if len(entities):
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1, norms)
+        return cls(
+            matrix=matrix,
+            names=[e.name for e in entities],
+            labels=[e.label for e in entities],
+            properties=[dict(e.properties) for e in entities],
+            version=version,
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def save(self, path='entity_index'):
+        np.save(f"{path}.npy", self.matrix)
+        with open(f"{path}.json", 'w') as outp:
+            json.dump({
+                "version": self.version,
+                "names": self.names,
+                "labels": self.labels,
+                "properties": self.properties,
+            }, outp)
+
+    @classmethod
+    def load(cls, path='entity_index'):
+        """
+           Load a saved index, memory-mapping the embedding matrix
+        """
+        matrix = np.load(f"{path}.npy", mmap_mode='r')
+        with open(f"{path}.json") as inp:
+            meta = json.load(inp)
+        return cls(
+            matrix=matrix, names=meta["names"], labels=meta["labels"], properties=meta["properties"],
+            version=meta.get("version"),
+        )
+
+    @staticmethod
+    def exists(path='entity_index'):
+        return os.path.exists(f"{path}.npy") and os.path.exists(f"{path}.json")
+
+    def search(self, embeddings, top_k=10):
+        """
+           Find the top_k most similar entities for each query embedding.
+
+           Args:
+               embeddings: A single embedding or a list of embeddings
+
+           Returns:
+               list: (indices, scores) per query, best first
+        """
+        queries = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+        if not len(self):
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+
+        queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+        scores = queries @ self.matrix.T
+        k = min(top_k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+        results = []
+        for row, candidates in zip(scores, top):
+            order = candidates[np.argsort(-row[candidates])]
+            results.append((order, row[order]))
+        return results
+
+    def get_node(self, i):
+        return EntityNode(name=self.names[i], label=self.labels[i], properties=dict(self.properties[i]))
+
+    def query(self, embedding, top_k=10):
+        """
+           Return the top_k EntityNodes and their similarity scores for one embedding
+        """
+        indices, scores = self.search(embedding, top_k)[0]
+        return [self.get_node(i) for i in indices], scores.tolist()